@@ -0,0 +1,66 @@
+import struct
+
+from django.contrib.gis.db.models.functions import AsWKB
+from django.db.models import BinaryField, Func, Value
+from django.db.models.functions import Coalesce
+
+from geo_db.additional_modules.geometry import GeometryOptions
+from geo_db.models import AsGeometry
+
+# Бинарные форматы геометрии: байты приходят из PostGIS (ST_AsBinary / ST_AsEWKB / ST_AsTWKB)
+# и записываются в ответ без GEOS и JSON.
+# Запись объекта: id (uint64), длина properties (uint32), properties JSON, длина геометрии (uint32), геометрия.
+# Все числа little-endian, записи идут подряд
+RECORD_HEADER = struct.Struct("<QI")
+GEOMETRY_LENGTH = struct.Struct("<I")
+# Знаков после запятой в TWKB, если не задан ?precision (около 1 см)
+TWKB_DEFAULT_PRECISION = 7
+
+
+class AsEWKB(Func):
+    function = "ST_AsEWKB"
+    output_field = BinaryField()
+
+
+class AsTWKB(Func):
+    function = "ST_AsTWKB"
+    output_field = BinaryField()
+
+
+def geometry_bytes(encoding: str, geometry, options: GeometryOptions):
+    # geometry - как в geojson.geometry_json: имя поля, выражение или None (пустая геометрия)
+    if geometry is None:
+        return Value(b"", output_field=BinaryField())
+    if isinstance(geometry, str):
+        field = geometry
+        geometry = AsGeometry("coordinates")
+        if field != "coordinates":
+            # Упрощённая геометрия ещё не рассчитана - отдаётся исходная
+            geometry = Coalesce(AsGeometry(field), geometry)
+
+    if encoding == "wkb":
+        return AsWKB(geometry)
+    if encoding == "ewkb":
+        return AsEWKB(geometry)
+    precision = options.precision if options.precision is not None else TWKB_DEFAULT_PRECISION
+    return AsTWKB(geometry, Value(precision))
+
+
+def encode_record(pk: int, properties: str, geometry) -> bytes:
+    properties = properties.encode("utf-8")
+    geometry = bytes(geometry)
+    return b"".join([RECORD_HEADER.pack(pk, len(properties)), properties, GEOMETRY_LENGTH.pack(len(geometry)),
+                     geometry])
+
+
+def decode_records(content: bytes):
+    offset = 0
+    while offset < len(content):
+        pk, properties_length = RECORD_HEADER.unpack_from(content, offset)
+        offset += RECORD_HEADER.size
+        properties = content[offset:offset + properties_length].decode("utf-8")
+        offset += properties_length
+        (geometry_length,) = GEOMETRY_LENGTH.unpack_from(content, offset)
+        offset += GEOMETRY_LENGTH.size
+        yield pk, properties, content[offset:offset + geometry_length]
+        offset += geometry_length
@@ -0,0 +1,25 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.ASYNC_BLOCKING_WORKERS,
+                                       thread_name_prefix="geo_db_blocking")
+    return _executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    # GEOS/GDAL и работа с файлами из async view, без обращений к БД.
+    # Пул ограничен, чтобы медленная сериализация не занимала все потоки процесса
+    # Контекст копируется, чтобы время сериализации попадало в метрики запроса
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), functools.partial(context.run, func, *args, **kwargs))
@@ -0,0 +1,134 @@
+import json
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count
+from rest_framework.exceptions import ValidationError
+
+from geo_db.additional_modules.validation import validate_polygons
+
+# Натуральные ключи как у bulk эндпоинтов (bulk_natural_key во views), по ним работает upsert
+NATURAL_KEYS = {
+    "country": ("name",),
+    "city": ("name", "country"),
+    "capital": ("country",),
+}
+
+
+def get_bulk_items(data) -> list:
+    # FeatureCollection или массив объектов / Feature
+    if isinstance(data, dict) and data.get("type") == "FeatureCollection":
+        data = data.get("features")
+    if not isinstance(data, list):
+        raise ValidationError({"detail": "FeatureCollection or array is required"})
+    if len(data) > settings.BULK_MAX_ITEMS:
+        raise ValidationError({"detail": f"max {settings.BULK_MAX_ITEMS} items"})
+    return data
+
+
+def get_item_data(item):
+    if not isinstance(item, dict) or item.get("type") != "Feature":
+        return item
+
+    data = dict(item.get("properties") or {})
+    if item.get("geometry") is not None:
+        data["coordinates"] = json.dumps(item["geometry"])
+    return data
+
+
+def check_coordinates(items: dict) -> list[dict]:
+    # Геометрии всех элементов проверяются одним пакетом, ошибочные элементы удаляются из items
+    indexes = list(items.keys())
+    polygons, polygon_errors = validate_polygons([items[index]["coordinates"] for index in indexes],
+                                                 settings.GEOMETRY_MAKE_VALID)
+    errors = []
+    for index, polygon, error in zip(indexes, polygons, polygon_errors):
+        if error is not None:
+            errors.append({"index": index, "errors": {"coordinates": [error]}})
+            del items[index]
+        else:
+            items[index]["coordinates"] = polygon
+    return errors
+
+
+def get_natural_key(obj, attnames) -> tuple:
+    return tuple(getattr(obj, attname) for attname in attnames)
+
+
+def check_objects(model, objs: dict, natural_key) -> list[dict]:
+    # Удаляет из objs объекты с повторяющимся ключом и несуществующими связями, возвращает ошибки.
+    # Повтор ключа в одном INSERT ... ON CONFLICT DO UPDATE - ошибка PostgreSQL, поэтому он отсекается здесь
+    errors = []
+    attnames = [model._meta.get_field(field).attname for field in natural_key]
+    seen = set()
+    for index, obj in list(objs.items()):
+        key = get_natural_key(obj, attnames)
+        if key in seen:
+            errors.append({"index": index, "errors": {"non_field_errors": [f"duplicate {', '.join(natural_key)}"]}})
+            del objs[index]
+        seen.add(key)
+
+    # Связанные объекты проверяются одним запросом на поле, а не на каждый элемент
+    for field in model._meta.concrete_fields:
+        if not field.is_relation:
+            continue
+        ids = {getattr(obj, field.attname) for obj in objs.values()}
+        existing = set(field.related_model.objects.filter(pk__in=ids).values_list("pk", flat=True))
+        for index, obj in list(objs.items()):
+            value = getattr(obj, field.attname)
+            if value not in existing:
+                errors.append({"index": index, "errors": {field.name: [f"object {value} does not exist"]}})
+                del objs[index]
+    return errors
+
+
+def has_unique_index(model, natural_key) -> bool:
+    # ON CONFLICT требует уникального индекса или ограничения ровно на полях ключа
+    attnames = {model._meta.get_field(field).attname for field in natural_key}
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+    return any(constraint["unique"] and set(constraint["columns"]) == attnames for constraint in constraints.values())
+
+
+def get_duplicate_keys(model, natural_key, limit: int = 20) -> list[tuple]:
+    attnames = [model._meta.get_field(field).attname for field in natural_key]
+    duplicates = model.objects.values(*attnames).annotate(count=Count("pk")).filter(count__gt=1).order_by(*attnames)
+    return [tuple(duplicate[attname] for attname in attnames) for duplicate in duplicates[:limit]]
+
+
+def create_unique_index(model, natural_key) -> str:
+    # Уникальность натурального ключа включается отдельно (import_geo --upsert, natural_key_index):
+    # обычный POST по-прежнему допускает одинаковые названия. Повторы не переименовываются
+    attnames = [model._meta.get_field(field).attname for field in natural_key]
+    name = f"{model._meta.db_table}_{'_'.join(attnames)}_uniq"
+    if has_unique_index(model, natural_key):
+        return name
+
+    duplicates = get_duplicate_keys(model, natural_key)
+    if duplicates:
+        raise ValueError(f"{model.__name__} has duplicate {', '.join(natural_key)}: "
+                         f"{'; '.join(', '.join(map(str, key)) for key in duplicates)}")
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {quote(name)} ON {quote(model._meta.db_table)} "
+                       f"({', '.join(quote(attname) for attname in attnames)})")
+    return name
+
+
+def upsert(model, objs: list, natural_key, update_fields) -> tuple[list, list]:
+    # Вызывается внутри транзакции, возвращает id созданных и обновлённых объектов
+    if len(objs) == 0:
+        return [], []
+
+    attnames = [model._meta.get_field(field).attname for field in natural_key]
+    keys = [get_natural_key(obj, attnames) for obj in objs]
+    filters = {f"{attname}__in": {key[i] for key in keys} for i, attname in enumerate(attnames)}
+    existing = set(model.objects.filter(**filters).values_list(*attnames))
+
+    model.objects.bulk_create(objs, batch_size=settings.BULK_BATCH_SIZE, update_conflicts=True,
+                              unique_fields=natural_key, update_fields=update_fields)
+
+    created, updated = [], []
+    for obj, key in zip(objs, keys):
+        (updated if key in existing else created).append(obj.pk)
+    return created, updated
@@ -0,0 +1,83 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+
+# Ответ хранится с версиями моделей, от которых он зависит.
+# Запись в модель увеличивает её версию, и старые ключи больше не используются
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def get_version_key(model):
+    return f"geo_db:version:{model._meta.label_lower}"
+
+
+def get_versions(models) -> list:
+    cache = get_cache()
+    keys = [get_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Начальная версия по времени: после вытеснения счётчика из кэша версии не повторятся
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _bump_version(model):
+    cache = get_cache()
+    key = get_version_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def bump_version(model):
+    # Повтор после коммита сбрасывает ответы, закэшированные до окончания транзакции
+    _bump_version(model)
+    transaction.on_commit(lambda: _bump_version(model))
+
+
+def normalize_query_params(query_params) -> str:
+    items = []
+    for key, values in sorted(query_params.lists()):
+        for value in values:
+            items.append(f"{key}={' '.join(value.split())}")
+    return "&".join(items)
+
+
+def get_response_cache_key(request, models) -> str:
+    source = "|".join([request.path, normalize_query_params(request.GET), request.headers.get("Accept", "")])
+    digest = hashlib.sha1(source.encode("utf-8")).hexdigest()
+    versions = ".".join(str(version) for version in get_versions(models))
+    return f"geo_db:response:{digest}:{versions}"
+
+
+def get_cached_response(key):
+    cached = get_cache().get(key)
+    if cached is None:
+        return None
+
+    response = HttpResponse(cached["content"], status=cached["status"])
+    for header, value in cached["headers"].items():
+        response[header] = value
+    response["X-Cache"] = "HIT"
+    return response
+
+
+def set_cached_response(key, response):
+    if hasattr(response, "render"):
+        response.render()
+    get_cache().set(key, {
+        "content": response.content,
+        "status": response.status_code,
+        "headers": dict(response.items()),
+    })
+    response["X-Cache"] = "MISS"
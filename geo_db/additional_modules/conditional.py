@@ -0,0 +1,24 @@
+import hashlib
+
+from django.db.models import Count, Max
+
+from geo_db.additional_modules.cache import normalize_query_params
+
+
+def get_validators(queryset, request):
+    # Один агрегирующий запрос: время последнего изменения и количество объектов выборки
+    validators = queryset.aggregate(last_modified=Max("updated_at"), count=Count("pk"))
+    last_modified = validators["last_modified"]
+
+    source = "|".join([
+        request.path,
+        normalize_query_params(request.GET),
+        request.headers.get("Accept", ""),
+        str(validators["count"]),
+        last_modified.isoformat() if last_modified is not None else "",
+    ])
+    etag = f'"{hashlib.sha1(source.encode("utf-8")).hexdigest()}"'
+
+    if last_modified is not None:
+        last_modified = int(last_modified.timestamp())
+    return etag, last_modified
@@ -0,0 +1,81 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image
+
+from geo_db.additional_modules.cache import bump_version
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVES_DIR = "media/derivatives/"
+# Имя производного изображения (оно же поле Photo и значение ?size=): максимальный размер, формат PIL, расширение
+DERIVATIVES = {
+    "thumb": ((160, 160), "PNG", "png"),
+    "medium": ((800, 800), "PNG", "png"),
+    "webp": (None, "WEBP", "webp"),
+}
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        # spawn: fork из многопоточного сервера копирует в дочерний процесс соединения с БД и блокировки
+        _executor = ProcessPoolExecutor(max_workers=settings.PHOTO_DERIVATIVE_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def render_derivatives(source_path: str, target_dir: str, stem: str) -> dict:
+    # Выполняется в отдельном процессе, работает только с файлами и не обращается к базе
+    names = {}
+    with Image.open(source_path) as image:
+        image.load()
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+
+        for size, (max_size, image_format, extension) in DERIVATIVES.items():
+            derivative = image.copy()
+            if max_size is not None:
+                derivative.thumbnail(max_size)
+            name = f"{stem}_{size}.{extension}"
+            derivative.save(os.path.join(target_dir, name), image_format)
+            names[size] = DERIVATIVES_DIR + name
+    return names
+
+
+def save_derivatives(photo_id: int, names: dict):
+    from geo_db.models import Photo
+    Photo.objects.filter(pk=photo_id).update(**names)
+    bump_version(Photo)
+
+
+def submit_derivatives(photo):
+    target_dir = default_storage.path(DERIVATIVES_DIR)
+    os.makedirs(target_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(photo.image.name))[0]
+    return get_executor().submit(render_derivatives, photo.image.path, target_dir, stem)
+
+
+def schedule_derivatives(photo):
+    # Генерация запускается после коммита и не задерживает ответ на загрузку
+    transaction.on_commit(lambda: submit_derivatives(photo).add_done_callback(partial(_on_rendered, photo.pk)))
+
+
+def _on_rendered(photo_id: int, future):
+    # Вызывается в служебном потоке пула вне цикла запроса: соединение этого потока
+    # проверяется и закрывается так же, как в начале и конце запроса
+    close_old_connections()
+    try:
+        save_derivatives(photo_id, future.result())
+    except Exception:
+        logger.exception("derivatives of photo %s are not created", photo_id)
+    finally:
+        close_old_connections()
@@ -0,0 +1,168 @@
+import os
+import queue
+import shutil
+import tempfile
+import threading
+
+from django.conf import settings
+from django.contrib.gis.db.models.functions import AsWKB
+from django.db import models
+from osgeo import ogr, osr
+
+from geo_db.additional_modules.files import CHUNK_SIZE
+from geo_db.additional_modules.geometry import GeometryOptions
+
+# format -> драйвер OGR и расширение файла, ndjson пишется без OGR
+EXPORT_FORMATS = {
+    "ndjson": (None, "ndjson"),
+    "gpkg": ("GPKG", "gpkg"),
+    "fgb": ("FlatGeobuf", "fgb"),
+}
+# Выгрузка всегда содержит площадь
+EXPORT_QUERY_PARAMS = {"area": ""}
+
+
+def get_export_fields(serializer):
+    model = serializer.Meta.model
+    return [model._meta.get_field(atr) for atr in serializer.Meta.fields if atr not in ("id", "coordinates")]
+
+
+def iter_ndjson(queryset, serializer):
+    # Feature собирается в PostGIS, iterator() читает строки через серверный курсор пачками
+    queryset = serializer.annotate_feature_json(queryset, EXPORT_QUERY_PARAMS, GeometryOptions({}))
+    for feature in queryset.order_by("pk").values_list("feature_json", flat=True).iterator(
+            chunk_size=settings.EXPORT_CHUNK_SIZE):
+        yield feature.encode("utf-8") + b"\n"
+
+
+def get_ogr_field_type(field):
+    if isinstance(field, models.FloatField):
+        return ogr.OFTReal
+    if isinstance(field, (models.IntegerField, models.ForeignKey, models.OneToOneField)):
+        return ogr.OFTInteger64
+    return ogr.OFTString
+
+
+def create_layer(data_source, serializer, layer_name: str, options=()):
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    layer = data_source.CreateLayer(layer_name, srs, ogr.wkbPolygon, options=list(options))
+
+    fields = get_export_fields(serializer)
+    layer.CreateField(ogr.FieldDefn("id", ogr.OFTInteger64))
+    for field in fields:
+        layer.CreateField(ogr.FieldDefn(field.name, get_ogr_field_type(field)))
+    return layer, fields
+
+
+def write_features(layer, fields, queryset):
+    # Генератор: возвращает количество записанных объектов после каждой пачки EXPORT_CHUNK_SIZE
+    definition = layer.GetLayerDefn()
+    # Геометрия приходит из PostGIS в WKB и передаётся в OGR без GEOS
+    rows = queryset.order_by("pk").annotate(export_wkb=AsWKB("coordinates")).values_list(
+        "pk", *[field.attname for field in fields], "export_wkb")
+
+    count = 0
+    layer.StartTransaction()
+    for pk, *values, wkb in rows.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+        feature = ogr.Feature(definition)
+        feature.SetField("id", pk)
+        for field, value in zip(fields, values):
+            if value is not None:
+                feature.SetField(field.name, value)
+        feature.SetGeometryDirectly(ogr.CreateGeometryFromWkb(bytes(wkb)))
+        layer.CreateFeature(feature)
+        count += 1
+        if count % settings.EXPORT_CHUNK_SIZE == 0:
+            layer.CommitTransaction()
+            yield count
+            layer.StartTransaction()
+    layer.CommitTransaction()
+    yield count
+
+
+def write_ogr(queryset, serializer, export_format: str, path: str, layer_name: str) -> int:
+    driver_name, _ = EXPORT_FORMATS[export_format]
+    data_source = ogr.GetDriverByName(driver_name).CreateDataSource(path)
+    layer, fields = create_layer(data_source, serializer, layer_name)
+    count = 0
+    for count in write_features(layer, fields, queryset):
+        pass
+
+    layer = None
+    data_source = None
+    return count
+
+
+def read_pipe(path: str, chunks: queue.SimpleQueue):
+    # Открытие канала на чтение ждёт, пока OGR откроет его на запись
+    with open(path, "rb") as pipe:
+        while data := pipe.read1(CHUNK_SIZE):
+            chunks.put(data)
+
+
+def iter_chunks(chunks: queue.SimpleQueue):
+    while True:
+        try:
+            yield chunks.get_nowait()
+        except queue.Empty:
+            return
+
+
+def iter_flatgeobuf(queryset, serializer, layer_name: str):
+    # FlatGeobuf без пространственного индекса (SPATIAL_INDEX=NO) пишется последовательно: OGR пишет
+    # в именованный канал, поток читает его, и каждая пачка отдаётся клиенту сразу после записи.
+    # Отдельный поток нужен, чтобы запись большой геометрии не блокировалась на заполненном канале
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, f"{layer_name}.fgb")
+    chunks = queue.SimpleQueue()
+    layer = None
+    data_source = ogr.GetDriverByName("FlatGeobuf").CreateDataSource(path)
+    # Файл открывается при создании слоя, к этому моменту на его месте должен быть канал
+    os.mkfifo(path)
+    reader = threading.Thread(target=read_pipe, args=(path, chunks), daemon=True)
+    reader.start()
+    try:
+        layer, fields = create_layer(data_source, serializer, layer_name, ["SPATIAL_INDEX=NO"])
+        for _ in write_features(layer, fields, queryset):
+            yield from iter_chunks(chunks)
+    finally:
+        # Закрытие источника сбрасывает буфер OGR и закрывает канал, поток читает его до конца
+        layer = None
+        data_source = None
+        if reader.is_alive():
+            # Если слой не был создан, поток ещё ждёт открытия канала на запись
+            try:
+                os.close(os.open(path, os.O_WRONLY | os.O_NONBLOCK))
+            except OSError:
+                pass
+        reader.join()
+        shutil.rmtree(directory, ignore_errors=True)
+    yield from iter_chunks(chunks)
+
+
+def iter_ogr(queryset, serializer, export_format: str, layer_name: str):
+    if export_format == "fgb":
+        return iter_flatgeobuf(queryset, serializer, layer_name)
+    return iter_file_export(queryset, serializer, export_format, layer_name)
+
+
+def iter_file_export(queryset, serializer, export_format: str, layer_name: str):
+    # GeoPackage - база SQLite, которую OGR дописывает с произвольным доступом: файл можно отдать
+    # только целиком, поэтому он пишется во временный файл и затем отдаётся частями
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, f"{layer_name}.{EXPORT_FORMATS[export_format][1]}")
+        write_ogr(queryset, serializer, export_format, path, layer_name)
+        with open(path, "rb") as file:
+            while data := file.read(CHUNK_SIZE):
+                yield data
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def iter_export(queryset, serializer, export_format: str, layer_name: str):
+    if export_format == "ndjson":
+        return iter_ndjson(queryset, serializer)
+    return iter_ogr(queryset, serializer, export_format, layer_name)
@@ -0,0 +1,52 @@
+import json
+import re
+import uuid
+
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JSONFragment:
+    # Уже закодированный JSON (геометрия из GEOS/OGR), вставляется в ответ как есть, без json.loads
+    __slots__ = ("content",)
+
+    def __init__(self, content: str | bytes):
+        self.content = content.encode("utf-8") if isinstance(content, str) else content
+
+
+class FragmentJSONEncoder(JSONEncoder):
+    # Для json.dumps с отступами (browsable API), где вставка байтов невозможна
+    def default(self, obj):
+        if isinstance(obj, JSONFragment):
+            return json.loads(obj.content)
+        return super().default(obj)
+
+
+def dumps(data) -> bytes:
+    # orjson, если установлен, иначе стандартный json; фрагменты вставляются без повторного разбора
+    fragments = []
+    token = uuid.uuid4().hex
+    fallback = JSONEncoder()
+
+    def default(obj):
+        if isinstance(obj, JSONFragment):
+            if orjson is not None and hasattr(orjson, "Fragment"):
+                return orjson.Fragment(obj.content)
+            fragments.append(obj.content)
+            return f"{token}:{len(fragments) - 1}"
+        return fallback.default(obj)
+
+    if orjson is not None:
+        content = orjson.dumps(data, default=default)
+    else:
+        content = json.dumps(data, default=default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    if len(fragments) == 0:
+        return content
+    # Старые версии orjson и стандартный json: на месте фрагмента строка-метка, все метки заменяются за один проход
+    pattern = re.compile(rb'"' + token.encode("ascii") + rb':(\d+)"')
+    return pattern.sub(lambda match: fragments[int(match.group(1))], content)
@@ -0,0 +1,82 @@
+import hashlib
+import mimetypes
+import re
+
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_range(range_header: str, size: int):
+    # Поддерживается один диапазон, на несколько диапазонов отдаётся весь файл
+    match = RANGE_RE.match(range_header.strip())
+    if match is None:
+        return None
+
+    start, end = match.groups()
+    if start == "" and end == "":
+        raise ValueError("wrong range")
+    if start == "":
+        start, end = max(0, size - int(end)), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end != "" else size - 1
+
+    if start > end or start >= size:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+def iter_file(field_file, start: int, length: int):
+    # Файл открывается в генераторе: если ответ не будет прочитан, открытого файла не остаётся
+    with field_file.storage.open(field_file.name, "rb") as file:
+        file.seek(start)
+        while length > 0:
+            data = file.read(min(CHUNK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def file_response(request, field_file, last_modified, max_age: int = 3600):
+    size = field_file.size
+    last_modified = int(last_modified.timestamp())
+    etag = f'"{hashlib.md5(field_file.name.encode()).hexdigest()}-{size}-{last_modified}"'
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        # 304 тоже несёт валидаторы, иначе кэш клиента не обновит их
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        return response
+
+    content_type = mimetypes.guess_type(field_file.name)[0] or "application/octet-stream"
+    byte_range = None
+    range_header = request.headers.get("Range")
+    if range_header is not None and request.headers.get("If-Range", etag) == etag:
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+    if byte_range is None:
+        # FileResponse закрывает файл вместе с ответом
+        response = FileResponse(field_file.storage.open(field_file.name, "rb"), content_type=content_type)
+        response["Content-Length"] = size
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(iter_file(field_file, start, end - start + 1), status=206,
+                                         content_type=content_type)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = end - start + 1
+
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    patch_cache_control(response, private=True, max_age=max_age)
+    return response
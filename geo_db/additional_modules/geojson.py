@@ -0,0 +1,55 @@
+from django.contrib.gis.db.models.functions import AsGeoJSON
+from django.db.models import Func, TextField, Value
+from django.db.models.functions import Coalesce
+
+
+class JSONBuildObject(Func):
+    function = "json_build_object"
+    output_field = TextField()
+
+
+class JSONStripNulls(Func):
+    function = "json_strip_nulls"
+    output_field = TextField()
+
+
+class AsJSON(Func):
+    template = "(%(expressions)s)::json"
+    output_field = TextField()
+
+
+class AsText(Func):
+    template = "(%(expressions)s)::text"
+    output_field = TextField()
+
+
+def build_object(**values):
+    expressions = []
+    for key, value in values.items():
+        expressions += [Value(key), value]
+    return JSONBuildObject(*expressions)
+
+
+def geometry_json(geometry, precision: int = None):
+    # geometry - имя поля модели, выражение (bbox, центроид) или None для Feature без геометрии
+    if geometry is None:
+        return AsJSON(Value(None, output_field=TextField()))
+    if precision is None:
+        precision = 15
+    geojson = AsGeoJSON(geometry, precision=precision)
+    if isinstance(geometry, str) and geometry != "coordinates":
+        # Упрощённая геометрия ещё не рассчитана - отдаётся исходная
+        geojson = Coalesce(geojson, AsGeoJSON("coordinates", precision=precision))
+    return AsJSON(geojson)
+
+
+def feature_json(geometry, pk, properties: dict, precision: int = None):
+    # Feature собирается в PostGIS и приходит готовой строкой JSON, без разбора в python
+    return AsText(build_object(type=Value("Feature"),
+                               geometry=geometry_json(geometry, precision),
+                               id=pk,
+                               properties=JSONStripNulls(build_object(**properties))))
+
+
+def properties_json(properties: dict):
+    return AsText(JSONStripNulls(build_object(**properties)))
@@ -0,0 +1,86 @@
+from django.contrib.gis.geos import Point
+from rest_framework.exceptions import ValidationError
+
+# Сохранённые уровни детализации: поле модели и допуск упрощения в градусах, от грубого к точному
+LEVELS_OF_DETAIL = (
+    ("coordinates_low", 0.1),
+    ("coordinates_medium", 0.01),
+    ("coordinates_high", 0.001),
+)
+MAX_ZOOM = 24
+MAX_PRECISION = 15
+# ?geometry=: полная геометрия, охватывающий прямоугольник, центроид или без геометрии
+GEOMETRY_MODES = ("full", "bbox", "centroid", "none")
+
+
+def get_tolerance_for_zoom(zoom: int) -> float:
+    # Размер пикселя тайла 256x256 в градусах на данном зуме
+    return 360 / (256 * 2 ** zoom)
+
+
+class GeometryOptions:
+    def __init__(self, query_params):
+        try:
+            self.field = self._parse_field(query_params)
+            self.precision = self._parse_precision(query_params)
+            self.geometry = self._parse_geometry(query_params)
+            self.fields = self._parse_fields(query_params)
+        except ValueError as e:
+            raise ValidationError({"detail": e.args[0]})
+
+    @staticmethod
+    def _parse_field(query_params):
+        if "simplify" in query_params:
+            tolerance = float(query_params.get("simplify"))
+        elif "zoom" in query_params:
+            zoom = int(query_params.get("zoom"))
+            if not (0 <= zoom <= MAX_ZOOM):
+                raise ValueError(f"zoom in (0, ..., {MAX_ZOOM})")
+            tolerance = get_tolerance_for_zoom(zoom)
+        else:
+            return "coordinates"
+
+        for field, level_tolerance in LEVELS_OF_DETAIL:
+            if level_tolerance <= tolerance:
+                return field
+        return "coordinates"
+
+    @staticmethod
+    def _parse_precision(query_params):
+        if "precision" not in query_params:
+            return None
+        precision = int(query_params.get("precision"))
+        if not (0 <= precision <= MAX_PRECISION):
+            raise ValueError(f"precision in (0, ..., {MAX_PRECISION})")
+        return precision
+
+    @staticmethod
+    def _parse_geometry(query_params):
+        geometry = query_params.get("geometry", "full")
+        if geometry not in GEOMETRY_MODES:
+            raise ValueError(f"geometry in {GEOMETRY_MODES}")
+        return geometry
+
+    @staticmethod
+    def _parse_fields(query_params):
+        # ?fields=name,country - набор свойств Feature, None - все свойства
+        if "fields" not in query_params:
+            return None
+        return {field.strip() for field in query_params.get("fields").split(",") if field.strip()}
+
+    def include_area(self, query_params) -> bool:
+        return "area" in query_params or (self.fields is not None and "area" in self.fields)
+
+
+def parse_point(query_params) -> Point:
+    try:
+        lon = float(query_params["lon"])
+        lat = float(query_params["lat"])
+    except KeyError:
+        raise ValidationError({"detail": "lon and lat are required"})
+    except ValueError:
+        raise ValidationError({"detail": "lon and lat must be numbers"})
+
+    if not (-180.0 <= lon <= 180.0 and -90.0 <= lat <= 90.0):
+        raise ValidationError({"detail": "lon in (-180, 180), lat in (-90, 90)"})
+    return Point(lon, lat, srid=4326)
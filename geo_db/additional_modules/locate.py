@@ -0,0 +1,112 @@
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.contrib.gis.db.models.functions import AsWKB
+from django.db import connection
+from django.db.models import Count, Max
+from rest_framework.exceptions import ValidationError
+
+try:
+    import shapely
+except ImportError:
+    shapely = None
+
+# Обратное геокодирование точек: индекс STRtree в памяти процесса, без shapely - запрос к PostGIS.
+# Состояние таблицы (количество строк и max(updated_at)) проверяется в БД не чаще раза
+# в LOCATE_INDEX_CHECK_INTERVAL секунд, индекс перестраивается, если оно изменилось.
+# Так изменения, сделанные другими worker'ами, видны без общего кэша
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def parse_points(data) -> np.ndarray:
+    # [[lon, lat], ...] или {"points": [[lon, lat], ...]}
+    if isinstance(data, dict):
+        data = data.get("points")
+    if not isinstance(data, list) or len(data) == 0:
+        raise ValidationError({"detail": "points [[lon, lat], ...] are required"})
+    if len(data) > settings.LOCATE_MAX_POINTS:
+        raise ValidationError({"detail": f"max {settings.LOCATE_MAX_POINTS} points"})
+
+    try:
+        points = np.array(data, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValidationError({"detail": "points must be pairs of numbers [lon, lat]"})
+    if points.ndim != 2 or points.shape[1] != 2:
+        raise ValidationError({"detail": "points must be pairs of numbers [lon, lat]"})
+    if np.any(np.abs(points[:, 0]) > 180.0) or np.any(np.abs(points[:, 1]) > 90.0):
+        raise ValidationError({"detail": "lon in (-180, 180), lat in (-90, 90)"})
+    return points
+
+
+def use_index() -> bool:
+    return settings.LOCATE_INDEX and shapely is not None
+
+
+def get_state(model) -> tuple:
+    aggregates = model.objects.aggregate(count=Count("pk"), last_modified=Max("updated_at"))
+    return aggregates["count"], aggregates["last_modified"]
+
+
+def get_index(model):
+    # index: (состояние таблицы, время проверки, id, STRtree)
+    index = _indexes.get(model)
+    if index is not None and time.monotonic() - index[1] < settings.LOCATE_INDEX_CHECK_INTERVAL:
+        return index[2], index[3]
+
+    state = get_state(model)
+    with _lock:
+        index = _indexes.get(model)
+        if index is not None and index[0] == state:
+            index = (state, time.monotonic(), index[2], index[3])
+            _indexes[model] = index
+        else:
+            rows = model.objects.order_by("pk").annotate(locate_wkb=AsWKB("coordinates")).values_list(
+                "pk", "locate_wkb")
+            pks = np.array([pk for pk, _ in rows], dtype=np.int64)
+            geometries = shapely.from_wkb([bytes(wkb) for _, wkb in rows])
+            # Подготовленные геометрии ускоряют повторные проверки точка-в-полигоне
+            shapely.prepare(geometries)
+            index = (state, time.monotonic(), pks, shapely.STRtree(geometries))
+            _indexes[model] = index
+    return index[2], index[3]
+
+
+def locate_index(model, points: np.ndarray) -> list:
+    pks, tree = get_index(model)
+    # Все точки проверяются одним вызовом, результат - пары (номер точки, номер геометрии)
+    point_indexes, geometry_indexes = tree.query(shapely.points(points), predicate="intersects")
+    return collect(len(points), point_indexes, pks[geometry_indexes])
+
+
+def locate_database(model, points: np.ndarray) -> list:
+    # Одним запросом на модель: точки передаются массивами и разворачиваются через unnest
+    sql = (f"SELECT p.idx - 1, t.{model._meta.pk.column} "
+           f"FROM unnest(%s::float8[], %s::float8[]) WITH ORDINALITY AS p(lon, lat, idx) "
+           f"JOIN {model._meta.db_table} t "
+           f"ON ST_Intersects(t.coordinates, ST_SetSRID(ST_MakePoint(p.lon, p.lat), 4326)::geography)")
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [points[:, 0].tolist(), points[:, 1].tolist()])
+        rows = cursor.fetchall()
+
+    point_indexes = np.array([row[0] for row in rows], dtype=np.int64)
+    found = np.array([row[1] for row in rows], dtype=np.int64)
+    return collect(len(points), point_indexes, found)
+
+
+def collect(count: int, point_indexes: np.ndarray, found: np.ndarray) -> list:
+    # Если точка попала в несколько объектов, берётся объект с меньшим id
+    result = [None] * count
+    order = np.lexsort((-found, point_indexes))
+    for point_index, pk in zip(point_indexes[order].tolist(), found[order].tolist()):
+        result[point_index] = pk
+    return result
+
+
+def locate(models: dict, points: np.ndarray) -> list[dict]:
+    locate_model = locate_index if use_index() else locate_database
+    found = {name: locate_model(model, points) for name, model in models.items()}
+    return [{name: found[name][i] for name in models} for i in range(len(points))]
@@ -0,0 +1,168 @@
+import contextlib
+import contextvars
+import threading
+import time
+
+# Метрики запроса: время SQL и этапов ответа копятся в объекте текущего запроса (contextvar,
+# работает и в async view, и в потоках sync_to_async / run_blocking), после ответа уходят
+# в Server-Timing, лог и гистограммы /metrics. Гистограммы хранятся в памяти процесса
+
+# Границы корзин гистограмм: секунды, количество запросов к БД, байты ответа
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+# Этапы ответа: имя в Server-Timing и описание
+STAGES = {
+    "cache": "response cache",
+    "conditional": "ETag and Last-Modified",
+    "aggregate": "count and total_area",
+    "serialize": "serialization",
+    "geometry": "GEOS/OGR geometry JSON",
+    "render": "rendering",
+}
+
+_metrics = contextvars.ContextVar("geo_db_metrics", default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.stages = {}
+        self.route = None
+
+    def add(self, stage: str, elapsed: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + elapsed
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def server_timing(self) -> str:
+        items = [f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"']
+        items += [f'{stage};dur={elapsed * 1000:.1f};desc="{STAGES[stage]}"' for stage, elapsed in self.stages.items()]
+        items.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(items)
+
+
+def start_request() -> (RequestMetrics, contextvars.Token):
+    metrics = RequestMetrics()
+    return metrics, _metrics.set(metrics)
+
+
+def finish_request(token: contextvars.Token):
+    _metrics.reset(token)
+
+
+def get_request_metrics() -> RequestMetrics | None:
+    return _metrics.get()
+
+
+@contextlib.contextmanager
+def activate(metrics: RequestMetrics):
+    # Для кода, который выполняется после выхода из middleware (чанки StreamingHttpResponse)
+    token = _metrics.set(metrics)
+    try:
+        yield
+    finally:
+        _metrics.reset(token)
+
+
+@contextlib.contextmanager
+def timer(stage: str):
+    # Вне запроса (команды, тесты сериализаторов) ничего не измеряется
+    metrics = _metrics.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(stage, time.perf_counter() - start)
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    # Подключается ко всем соединениям (signals.py), считает запросы текущего запроса
+    metrics = _metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db += time.perf_counter() - start
+        metrics.queries += 1
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # route -> (счётчики корзин, сумма, количество)
+        self.values = {}
+
+    def observe(self, route: str, value: float):
+        counts, total, count = self.values.get(route) or ([0] * len(self.buckets), 0.0, 0)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        self.values[route] = (counts, total + value, count + 1)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for route, (counts, total, count) in sorted(self.values.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{route="{route}",le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{route="{route}",le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{route="{route}"}} {total}')
+            lines.append(f'{self.name}_count{{route="{route}"}} {count}')
+        return lines
+
+
+HISTOGRAMS = {
+    "duration": Histogram("geo_db_request_duration_seconds", "Request duration", TIME_BUCKETS),
+    "db": Histogram("geo_db_db_duration_seconds", "SQL time per request", TIME_BUCKETS),
+    "queries": Histogram("geo_db_db_queries", "SQL queries per request", QUERY_BUCKETS),
+    "serialize": Histogram("geo_db_serialize_duration_seconds", "Serialization time per request", TIME_BUCKETS),
+    "render": Histogram("geo_db_render_duration_seconds", "Rendering time per request", TIME_BUCKETS),
+    "bytes": Histogram("geo_db_response_bytes", "Response payload size", BYTES_BUCKETS),
+}
+_lock = threading.Lock()
+
+
+def observe(metrics: RequestMetrics, duration: float, payload_bytes: int):
+    route = metrics.route or "unmatched"
+    with _lock:
+        HISTOGRAMS["duration"].observe(route, duration)
+        HISTOGRAMS["db"].observe(route, metrics.db)
+        HISTOGRAMS["queries"].observe(route, metrics.queries)
+        HISTOGRAMS["serialize"].observe(route, metrics.stages.get("serialize", 0.0))
+        HISTOGRAMS["render"].observe(route, metrics.stages.get("render", 0.0))
+        HISTOGRAMS["bytes"].observe(route, payload_bytes)
+
+
+def render_metrics() -> str:
+    with _lock:
+        lines = []
+        for histogram in HISTOGRAMS.values():
+            lines += histogram.render()
+    return "\n".join(lines) + "\n"
+
+
+def get_log_record(request, response, metrics: RequestMetrics, duration: float, payload_bytes: int) -> dict:
+    return {
+        "method": request.method,
+        "path": request.path,
+        "route": metrics.route,
+        "status": response.status_code,
+        "duration_ms": round(duration * 1000, 1),
+        "db_queries": metrics.queries,
+        "db_ms": round(metrics.db * 1000, 1),
+        **{f"{stage}_ms": round(elapsed * 1000, 1) for stage, elapsed in metrics.stages.items()},
+        "bytes": payload_bytes,
+        "streaming": response.streaming,
+    }
+
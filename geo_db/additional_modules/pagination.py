@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
 
+from django.core import signing
+from rest_framework.exceptions import ValidationError
 from rest_framework.request import Request
 
 
@@ -54,6 +56,12 @@ class Paginator(ABC):
     def get_end(self):
         return self.offset + self.limit
 
+    def paginate_queryset(self, queryset):
+        return queryset[self.get_start():self.get_end()]
+
+    def set_page_bounds(self, first_pk, last_pk, page_size: int):
+        pass
+
     def get_pagination_data(self, count_data: int):
         previous_link, next_link = self.get_links_pagination(count_data)
         return {
@@ -119,10 +127,82 @@ class PaginatorPage(Paginator):
         return previous_link, next_link
 
 
+class PaginatorCursor(Paginator):
+    salt = "geo_db.pagination.cursor"
+
+    def __init__(self, request: Request):
+        self.position = None
+        self.reverse = False
+        self.first_pk = None
+        self.last_pk = None
+        self.page_size = 0
+        super().__init__(request)
+
+    @classmethod
+    def get_name_pagination_query_params(cls) -> tuple:
+        return "cursor", "limit"
+
+    def _parse_value_pagination(self):
+        limit = int(self._request.query_params.get("limit", self._set_default_limit()))
+        if limit <= 0:
+            limit = self._set_default_limit()
+
+        # Ключ курсора - первичный ключ, другой порядок страниц (?ordering=-area) он не поддерживает
+        if self._request.query_params.get("ordering", "id") != "id":
+            raise ValidationError({"detail": "cursor pagination is ordered by id, use limit/offset for ordering"})
+
+        cursor = self._request.query_params.get("cursor")
+        if cursor:
+            try:
+                self.position, self.reverse = signing.loads(cursor, salt=self.salt)
+            except (signing.BadSignature, TypeError, ValueError):
+                raise ValidationError({"detail": "invalid cursor"})
+        return limit
+
+    def _convert_to_limit_offset(self, data) -> (int, int):
+        return data, 0
+
+    def paginate_queryset(self, queryset):
+        # Поиск по индексу первичного ключа вместо OFFSET, цена страницы не зависит от её номера
+        queryset = queryset.order_by("pk")
+        if self.position is None:
+            return queryset[:self.limit]
+        if not self.reverse:
+            return queryset.filter(pk__gt=self.position)[:self.limit]
+
+        page_pks = queryset.filter(pk__lt=self.position).order_by("-pk").values("pk")[:self.limit]
+        return queryset.filter(pk__in=page_pks)
+
+    def set_page_bounds(self, first_pk, last_pk, page_size: int):
+        self.first_pk = first_pk
+        self.last_pk = last_pk
+        self.page_size = page_size
+
+    def _get_cursor_link(self, position, reverse: bool):
+        cursor = signing.dumps([position, reverse], salt=self.salt)
+        return self._get_url_without_pagination() + f"cursor={cursor}&limit={self.limit}"
+
+    def get_links_pagination(self, count_data: int) -> (str, str):
+        full_page = self.page_size == self.limit
+
+        next_link = None
+        if self.page_size != 0 and (self.reverse or full_page):
+            next_link = self._get_cursor_link(self.last_pk, False)
+
+        previous_link = None
+        if self.page_size != 0 and (full_page if self.reverse else self.position is not None):
+            previous_link = self._get_cursor_link(self.first_pk, True)
+        elif self.page_size == 0 and self.position is not None and not self.reverse:
+            previous_link = self._get_cursor_link(self.position, True)
+        return previous_link, next_link
+
+
 def get_paginator(request):
     query_params = request.query_params.keys()
 
-    if len(set(query_params) & set(PaginatorLimitOffset.get_name_pagination_query_params())) != 0:
+    if "cursor" in query_params:
+        paginator = PaginatorCursor(request)
+    elif len(set(query_params) & set(PaginatorLimitOffset.get_name_pagination_query_params())) != 0:
         paginator = PaginatorLimitOffset(request)
     elif len(set(query_params) & set(PaginatorPage.get_name_pagination_query_params())) != 0:
         paginator = PaginatorPage(request)
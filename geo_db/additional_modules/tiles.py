@@ -0,0 +1,60 @@
+import math
+
+from django.contrib.gis.db import models
+from django.contrib.gis.geos import Polygon
+from django.db import connection
+from django.db.models import Func
+from django.db.models.functions import Cast, Coalesce
+
+from geo_db.additional_modules.geometry import GeometryOptions
+
+MAX_ZOOM = 24
+EXTENT = 4096
+BUFFER = 64
+
+
+class AsMVTGeom(Func):
+    function = "ST_AsMVTGeom"
+    template = "%(function)s(ST_Transform(%(expressions)s, 3857), ST_TileEnvelope(%(z)d, %(x)d, %(y)d), %(extent)d, %(buffer)d, true)"
+    output_field = models.GeometryField(srid=3857)
+
+
+def validate_tile(z: int, x: int, y: int):
+    if not (0 <= z <= MAX_ZOOM):
+        raise ValueError(f"z in (0, ..., {MAX_ZOOM})")
+    if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise ValueError(f"x and y in (0, ..., {2 ** z - 1})")
+
+
+def get_tile_bbox(z: int, x: int, y: int):
+    # Границы тайла XYZ в долготе/широте (EPSG:4326)
+    n = 2 ** z
+    lon_min = x / n * 360 - 180
+    lon_max = (x + 1) / n * 360 - 180
+    lat_max = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    lat_min = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return lon_min, lat_min, lon_max, lat_max
+
+
+def get_tile(queryset, layer: str, z: int, x: int, y: int) -> bytes:
+    tile_polygon = Polygon.from_bbox(get_tile_bbox(z, x, y))
+    tile_polygon.srid = 4326
+
+    # На мелких масштабах берётся сохранённая упрощённая геометрия
+    field = GeometryOptions({"zoom": z}).field
+    geometry = Cast("coordinates", models.PolygonField(srid=4326))
+    if field != "coordinates":
+        geometry = Coalesce(field, geometry)
+
+    queryset = queryset.filter(coordinates__bboverlaps=tile_polygon) \
+        .annotate(mvt_geom=AsMVTGeom(geometry, z=z, x=x, y=y, extent=EXTENT, buffer=BUFFER)) \
+        .values("id", "name", "area", "mvt_geom")
+    sql, params = queryset.query.sql_with_params()
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT ST_AsMVT(tile, %s, {EXTENT}, 'mvt_geom') FROM ({sql}) AS tile", [layer, *params])
+        tile = cursor.fetchone()[0]
+
+    if tile is None:
+        return b""
+    return bytes(tile)
@@ -1,3 +1,7 @@
+import numpy as np
+from django.contrib.gis.geos import GEOSGeometry
+
+
 def parse_valid_bbox(bbox: str):
     bbox_coords = bbox.split()
     bbox_coords = [float(coord) for coord in bbox_coords]
@@ -6,3 +10,57 @@ def parse_valid_bbox(bbox: str):
         raise Exception("bbox required format x_min y_min x_max y_max")
 
     return bbox_coords
+
+
+COORDINATES_RANGE_ERROR = ("Coordinates out of range: longitude must be between -180 and 180, "
+                           "latitude must be between -90 and 90")
+
+
+def parse_polygon(value, make_valid: bool = False):
+    # Возвращает (polygon, None) или (None, текст ошибки)
+    try:
+        polygon = value if isinstance(value, GEOSGeometry) else GEOSGeometry(value)
+    except Exception as e:
+        return None, str(e)
+
+    if polygon.geom_type != "Polygon":
+        return None, "geom must be a Polygon"
+    if polygon.empty:
+        return None, "geom must not be empty"
+
+    if not polygon.valid:
+        reason = polygon.valid_reason
+        # NaN и бесконечные координаты make_valid не исправляет
+        if not make_valid or reason.startswith("Invalid Coordinate"):
+            return None, f"geom is not a valid polygon: {reason}"
+        polygon = polygon.make_valid()
+        if polygon.geom_type != "Polygon":
+            return None, f"geom is not a valid polygon: {reason}, repaired geometry is a {polygon.geom_type}"
+    return polygon, None
+
+
+def validate_polygons(values, make_valid: bool = False) -> tuple[list, list]:
+    # Пакетная проверка: разбор и valid выполняет GEOS (по вызову на геометрию), диапазон координат
+    # проверяется одной операцией numpy по охватам (extent) всех полигонов: кольца валидного полигона
+    # лежат внутри охвата. Возвращает списки полигонов и ошибок той же длины, что values
+    polygons, errors = [], []
+    checked, extents = [], []
+    for index, value in enumerate(values):
+        polygon, error = parse_polygon(value, make_valid)
+        polygons.append(polygon)
+        errors.append(error)
+        if polygon is not None:
+            checked.append(index)
+            extents.append(polygon.extent)
+
+    if len(checked) == 0:
+        return polygons, errors
+
+    extents = np.array(extents, dtype=float)
+    # Сравнение "не в диапазоне" вместо "больше границы": NaN не проходит проверку
+    out_of_range = (~(np.abs(extents[:, [0, 2]]) <= 180.0).all(axis=1)
+                    | ~(np.abs(extents[:, [1, 3]]) <= 90.0).all(axis=1))
+    for index in np.asarray(checked)[out_of_range]:
+        polygons[index] = None
+        errors[index] = COORDINATES_RANGE_ERROR
+    return polygons, errors
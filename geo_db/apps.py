@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class GeoDbConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'geo_db'
+
+    def ready(self):
+        from geo_db import signals  # noqa: F401
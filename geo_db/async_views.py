@@ -0,0 +1,128 @@
+import functools
+
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+
+from geo_db.additional_modules.blocking import run_blocking
+from geo_db.additional_modules.derivatives import DERIVATIVES
+from geo_db.additional_modules.geometry import GeometryOptions
+from geo_db.additional_modules.pagination import get_paginator
+from geo_db.filters import CountryFilter, CityFilter, CapitalFilter
+from geo_db.models import Country, City, Capital, Photo
+from geo_db.serializers import CountySerializer, CitySerializer, CapitalSerializer, DataCollectionSerializer
+
+# Async версии GET эндпоинтов geo_db/views.py для запуска через server/asgi.py:
+# запросы к PostGIS идут через async ORM, пока они выполняются, worker обслуживает другие запросы
+RESOURCES = {
+    "countries": (Country, CountySerializer, CountryFilter),
+    "cities": (City, CitySerializer, CityFilter),
+    "capitals": (Capital, CapitalSerializer, CapitalFilter),
+}
+
+
+def async_api_view(view):
+    @require_GET
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            # Request DRF нужен для query_params пагинации и сериализаторов
+            return await view(Request(request), *args, **kwargs)
+        except ValidationError as e:
+            return JsonResponse(e.detail, status=400)
+    return wrapper
+
+
+def not_found(name: str):
+    return JsonResponse({"detail": f"{name} not found"}, status=404)
+
+
+def json_response(content: bytes):
+    return HttpResponse(content, content_type="application/json")
+
+
+def get_context(request: Request, options: GeometryOptions):
+    return {"request": request, "geometry": options, "json_fragments": True}
+
+
+async def feature_collection_response(request: Request, queryset, serializer, filter_class):
+    paginator = get_paginator(request)
+    options = GeometryOptions(request.query_params)
+    queryset = serializer.project_queryset(filter_class(data=request.query_params, queryset=queryset).qs, options)
+    content = await DataCollectionSerializer.aget_feature_collection(queryset, serializer,
+                                                                     get_context(request, options),
+                                                                     paginator,
+                                                                     request.query_params)
+    return json_response(content)
+
+
+async def feature_response(request: Request, obj, serializer, options: GeometryOptions):
+    feature = await run_blocking(lambda: serializer(obj, context=get_context(request, options)).data)
+    return json_response(DataCollectionSerializer.encode(feature))
+
+
+@async_api_view
+async def feature_list(request: Request, resource: str):
+    if resource not in RESOURCES:
+        return not_found(resource)
+    model, serializer, filter_class = RESOURCES[resource]
+    return await feature_collection_response(request, model.objects.all(), serializer, filter_class)
+
+
+@async_api_view
+async def feature_retrieve(request: Request, resource: str, pk: int):
+    if resource not in RESOURCES:
+        return not_found(resource)
+    model, serializer, _ = RESOURCES[resource]
+    options = GeometryOptions(request.query_params)
+    obj = await serializer.project_queryset(model.objects.filter(pk=pk), options).afirst()
+    if obj is None:
+        return not_found(model.__name__)
+    return await feature_response(request, obj, serializer, options)
+
+
+@async_api_view
+async def country_cities(request: Request, pk: int):
+    if not await Country.objects.filter(pk=pk).aexists():
+        return not_found("Country")
+    return await feature_collection_response(request, City.objects.filter(country_id=pk), CitySerializer, CityFilter)
+
+
+@async_api_view
+async def country_capital(request: Request, pk: int):
+    if not await Country.objects.filter(pk=pk).aexists():
+        return not_found("Country")
+
+    options = GeometryOptions(request.query_params)
+    capital = await CapitalSerializer.project_queryset(Capital.objects.filter(country_id=pk), options).afirst()
+    if capital is None:
+        return not_found("capital")
+    return await feature_response(request, capital, CapitalSerializer, options)
+
+
+@async_api_view
+async def city_images(request: Request, pk: int, num_image: int = None):
+    if not await City.objects.filter(pk=pk).aexists():
+        return not_found("City")
+
+    size = request.query_params.get("size")
+    if size is not None and size not in DERIVATIVES:
+        return JsonResponse({"detail": f"size in {tuple(DERIVATIVES.keys())}"}, status=400)
+
+    photos = Photo.objects.filter(city_id=pk).order_by("time_created", "id")
+    total_images = await photos.acount()
+    if num_image is None:
+        return JsonResponse({"total_images": total_images})
+
+    if not (0 < num_image <= total_images):
+        return JsonResponse({"detail": f"num_image in (1, ..., {total_images})"}, status=400)
+
+    photo = await photos[num_image - 1:num_image].afirst()
+    # Чтение файла и base64 не блокируют цикл событий
+    base64_image = await run_blocking(photo.get_image_base64, size)
+    return JsonResponse({
+        "total_images": total_images,
+        "number_image": num_image,
+        "base64_image": base64_image
+    })
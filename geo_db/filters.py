@@ -1,3 +1,6 @@
+import asyncio
+import logging
+
 import django_filters
 from django.contrib.gis.geos import Polygon
 from rest_framework.exceptions import ValidationError
@@ -5,9 +8,31 @@ from rest_framework.exceptions import ValidationError
 from geo_db.additional_modules.validation import parse_valid_bbox
 from geo_db.models import Country, City, Capital
 
+logger = logging.getLogger(__name__)
+
+
+def in_async_context() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+# bbox_overlaps - только сравнение bounding box (&&) по GiST индексу geography
+# intersects - ST_Intersects по geography, within - ST_Within по индексу coordinates::geometry
+BBOX_PREDICATES = {
+    "bbox_overlaps": "coordinates__bboverlaps",
+    "intersects": "coordinates__intersects",
+    "within": "coordinates__within",
+}
+
 
 class BaseGeoFilter(django_filters.FilterSet):
     bbox = django_filters.Filter(method='filter_bbox')
+    min_area = django_filters.NumberFilter(field_name='area', lookup_expr='gte')
+    max_area = django_filters.NumberFilter(field_name='area', lookup_expr='lte')
+    ordering = django_filters.OrderingFilter(fields=('id', 'name', 'area'))
 
     def filter_bbox(self, queryset, name, *args, **kwargs):
         try:
@@ -15,24 +40,33 @@ class BaseGeoFilter(django_filters.FilterSet):
         except Exception as e:
             raise ValidationError({"detail": e.args[0]})
 
+        predicate = self.data.get("predicate", "within")
+        if predicate not in BBOX_PREDICATES:
+            raise ValidationError({"detail": f"predicate in {tuple(BBOX_PREDICATES.keys())}"})
+
         bbox_polygon = Polygon.from_bbox(bbox_coords)
-        queryset = queryset.filter(coordinates__within=bbox_polygon)
+        bbox_polygon.srid = 4326
+        queryset = queryset.filter(**{BBOX_PREDICATES[predicate]: bbox_polygon})
+
+        # В async view (async_views.py) синхронный EXPLAIN вызвал бы SynchronousOnlyOperation
+        if logger.isEnabledFor(logging.DEBUG) and not in_async_context():
+            logger.debug("bbox predicate %s plan:\n%s", predicate, queryset.explain())
         return queryset
 
 
 class CountryFilter(BaseGeoFilter):
     class Meta:
         model = Country
-        fields = ['bbox']
+        fields = ['bbox', 'min_area', 'max_area', 'ordering']
 
 
 class CityFilter(BaseGeoFilter):
     class Meta:
         model = City
-        fields = ['bbox']
+        fields = ['bbox', 'min_area', 'max_area', 'ordering']
 
 
 class CapitalFilter(BaseGeoFilter):
     class Meta:
         model = Capital
-        fields = ['bbox']
+        fields = ['bbox', 'min_area', 'max_area', 'ordering']
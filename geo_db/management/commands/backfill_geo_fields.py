@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from geo_db.additional_modules.geometry import LEVELS_OF_DETAIL
+from geo_db.models import Country, City, Capital
+
+MODELS = {
+    "country": Country,
+    "city": City,
+    "capital": Capital,
+}
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает сохранённые поля (area, упрощённые геометрии) для уже существующих объектов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", choices=MODELS.keys(), action="append",
+                            help="модель для пересчёта, по умолчанию все")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--only-missing", action="store_true",
+                            help="пересчитать только объекты без сохранённых полей")
+
+    def handle(self, *args, model=None, batch_size=1000, only_missing=False, **options):
+        for name in model or MODELS.keys():
+            self.backfill(MODELS[name], batch_size, only_missing)
+
+    def backfill(self, model, batch_size: int, only_missing: bool):
+        queryset = model.objects.all()
+        if only_missing:
+            missing = Q(area__isnull=True)
+            for field, _ in LEVELS_OF_DETAIL:
+                missing |= Q(**{f"{field}__isnull": True})
+            queryset = queryset.filter(missing)
+
+        updated = 0
+        last_pk = 0
+        while True:
+            pks = list(queryset.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:batch_size])
+            if len(pks) == 0:
+                break
+            updated += model.objects.filter(pk__in=pks).update_computed_fields()
+            last_pk = pks[-1]
+            self.stdout.write(f"{model.__name__}: {updated}")
+
+        self.stdout.write(self.style.SUCCESS(f"{model.__name__}: updated {updated}"))
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from geo_db.additional_modules.fastjson import orjson
+from geo_db.additional_modules.geometry import GeometryOptions
+from geo_db.renderers import FastJSONRenderer
+from geo_db.serializers import CountySerializer, CitySerializer, CapitalSerializer
+
+MODELS = {
+    "country": CountySerializer,
+    "city": CitySerializer,
+    "capital": CapitalSerializer,
+}
+
+
+class Command(BaseCommand):
+    help = "Сравнивает время сериализации и рендеринга FeatureCollection: стандартный JSONRenderer и FastJSONRenderer"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", choices=MODELS.keys(), default="country")
+        parser.add_argument("--limit", type=int, help="количество объектов, по умолчанию все")
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, model="country", limit=None, repeat=5, **options):
+        serializer = MODELS[model]
+        queryset = serializer.Meta.model.objects.order_by("pk")
+        if limit is not None:
+            queryset = queryset[:limit]
+        # Объекты загружаются заранее, измеряется только сериализация и рендеринг
+        instances = list(queryset)
+        self.stdout.write(f"{model}: {len(instances)} objects, orjson {'yes' if orjson is not None else 'no'}")
+
+        cases = [
+            ("JSONRenderer, json.loads geometry", JSONRenderer(), False),
+            ("FastJSONRenderer, json.loads geometry", FastJSONRenderer(), False),
+            ("FastJSONRenderer, geometry fragments", FastJSONRenderer(), True),
+        ]
+        baseline = None
+        for name, renderer, json_fragments in cases:
+            context = {"geometry": GeometryOptions({}), "json_fragments": json_fragments}
+            best, size = self.measure(instances, serializer, context, renderer, repeat)
+            baseline = baseline or best
+            self.stdout.write(f"{name}: {best * 1000:.1f} ms, {size} bytes, x{baseline / best:.2f}")
+
+    @staticmethod
+    def measure(instances, serializer, context, renderer, repeat: int) -> (float, int):
+        best = None
+        size = 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            data = serializer(instances, context=context).data
+            size = len(renderer.render(data))
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, size
@@ -0,0 +1,56 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from geo_db.additional_modules.export import EXPORT_FORMATS, iter_ndjson, write_ogr
+from geo_db.filters import CountryFilter, CityFilter, CapitalFilter
+from geo_db.serializers import CountySerializer, CitySerializer, CapitalSerializer
+
+MODELS = {
+    "country": (CountySerializer, CountryFilter),
+    "city": (CitySerializer, CityFilter),
+    "capital": (CapitalSerializer, CapitalFilter),
+}
+
+
+class Command(BaseCommand):
+    help = "Выгрузка стран, городов или столиц в GeoPackage, FlatGeobuf или NDJSON (GeoJSON построчно)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="файл выгрузки, для ndjson '-' - stdout")
+        parser.add_argument("--model", choices=MODELS.keys(), required=True)
+        parser.add_argument("--format", dest="export_format", choices=EXPORT_FORMATS.keys(),
+                            help="по умолчанию по расширению файла")
+        parser.add_argument("--bbox", help="x_min y_min x_max y_max")
+        parser.add_argument("--predicate", default="within")
+
+    def handle(self, *args, output, model, export_format=None, bbox=None, predicate="within", **options):
+        if export_format is None:
+            export_format = output.rsplit(".", 1)[-1]
+            if export_format not in EXPORT_FORMATS:
+                raise CommandError(f"format in {tuple(EXPORT_FORMATS.keys())}")
+
+        serializer, filter_class = MODELS[model]
+        queryset = serializer.Meta.model.objects.all()
+        if bbox is not None:
+            try:
+                queryset = filter_class(data={"bbox": bbox, "predicate": predicate}, queryset=queryset).qs
+            except ValidationError as e:
+                raise CommandError(e.detail["detail"])
+
+        if export_format != "ndjson":
+            count = write_ogr(queryset, serializer, export_format, output, model)
+            self.stderr.write(self.style.SUCCESS(f"{model}: exported {count}"))
+            return
+
+        stream = sys.stdout.buffer if output == "-" else open(output, "wb")
+        count = 0
+        try:
+            for line in iter_ndjson(queryset, serializer):
+                stream.write(line)
+                count += 1
+        finally:
+            if stream is not sys.stdout.buffer:
+                stream.close()
+        self.stderr.write(self.style.SUCCESS(f"{model}: exported {count}"))
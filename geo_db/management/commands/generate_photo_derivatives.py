@@ -0,0 +1,36 @@
+from concurrent.futures import as_completed
+
+from django.core.management.base import BaseCommand
+
+from geo_db.additional_modules.derivatives import save_derivatives, submit_derivatives
+from geo_db.models import Photo
+
+
+class Command(BaseCommand):
+    help = "Создаёт производные изображения (thumb, medium, webp) для уже загруженных фото"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true",
+                            help="пересоздать для всех фото, по умолчанию только для фото без производных")
+
+    def handle(self, *args, all=False, **options):
+        photos = Photo.objects.exclude(image="")
+        if not all:
+            photos = photos.filter(thumb="")
+
+        futures = {}
+        for photo in photos.iterator():
+            futures[submit_derivatives(photo)] = photo.pk
+
+        done = 0
+        for future in as_completed(futures):
+            photo_id = futures[future]
+            try:
+                save_derivatives(photo_id, future.result())
+            except Exception as e:
+                self.stderr.write(f"photo {photo_id}: {e}")
+                continue
+            done += 1
+            self.stdout.write(f"{done}/{len(futures)}")
+
+        self.stdout.write(self.style.SUCCESS(f"created derivatives for {done} photos"))
@@ -0,0 +1,208 @@
+from django.contrib.gis.geos import GEOSGeometry
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from osgeo import ogr, osr
+
+from geo_db.additional_modules.bulk import NATURAL_KEYS, create_unique_index, get_natural_key, upsert
+from geo_db.additional_modules.validation import validate_polygons
+from geo_db.models import Country, City, Capital
+
+MODELS = {
+    "country": Country,
+    "city": City,
+    "capital": Capital,
+}
+
+# Поля моделей, которые можно заполнить из атрибутов источника
+MODEL_FIELDS = {
+    "country": ("name",),
+    "city": ("name", "description", "country"),
+    "capital": ("name", "country"),
+}
+
+# Сколько ошибок выводить подробно, остальные только считаются
+MAX_REPORTED_ERRORS = 20
+
+
+class Command(BaseCommand):
+    help = "Импорт стран, городов и столиц из Shapefile, GeoJSON, GeoPackage или FlatGeobuf"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="файл или источник данных OGR")
+        parser.add_argument("--model", choices=MODELS.keys(), required=True)
+        parser.add_argument("--layer", help="имя слоя, по умолчанию первый")
+        parser.add_argument("--map", dest="pairs", action="append", default=[], metavar="FIELD=SOURCE",
+                            help="соответствие поля модели атрибуту источника, например name=NAME_EN")
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument("--largest-part", action="store_true",
+                            help="из MultiPolygon брать наибольший полигон вместо пропуска объекта")
+        parser.add_argument("--make-valid", action="store_true",
+                            help="исправлять невалидные полигоны вместо пропуска объекта")
+        parser.add_argument("--upsert", action="store_true",
+                            help="обновлять существующие объекты по натуральному ключу (NATURAL_KEYS), "
+                                 "создаёт уникальный индекс на ключ, если его нет")
+
+    def handle(self, *args, path, model, layer=None, pairs=(), batch_size=2000, largest_part=False,
+               make_valid=False, upsert=False, **options):
+        data_source = ogr.Open(path)
+        if data_source is None:
+            raise CommandError(f"can not open {path}")
+        source_layer = data_source.GetLayerByName(layer) if layer else data_source.GetLayer(0)
+        if source_layer is None:
+            raise CommandError(f"layer {layer} not found")
+
+        self.model = MODELS[model]
+        self.mapping = self.get_mapping(model, source_layer, pairs)
+        self.transform = self.get_transform(source_layer)
+        self.largest_part = largest_part
+        self.make_valid = make_valid
+        self.countries = {}
+        if "country" in self.mapping:
+            for pk, name in Country.objects.values_list("pk", "name"):
+                self.countries[name] = pk
+        self.country_ids = set(self.countries.values())
+        self.upsert = upsert
+        self.natural_key = NATURAL_KEYS[model]
+        self.update_fields = [field for field in MODEL_FIELDS[model] + ("coordinates",)
+                              if field not in self.natural_key]
+        self.key_attnames = [self.model._meta.get_field(field).attname for field in self.natural_key]
+        if upsert:
+            try:
+                create_unique_index(self.model, self.natural_key)
+            except ValueError as e:
+                raise CommandError(f"{e}. Resolve the duplicates or import without --upsert")
+
+        total = source_layer.GetFeatureCount()
+        created, updated = 0, 0
+        self.errors = 0
+        batch = []
+        # Объекты читаются из слоя потоком, в памяти держится только текущая пачка
+        for feature in source_layer:
+            values, error = self.get_values(feature)
+            if error is not None:
+                self.report(feature.GetFID(), error)
+                continue
+
+            batch.append((feature.GetFID(), values))
+            if len(batch) >= batch_size:
+                batch_created, batch_updated = self.flush(batch)
+                created += batch_created
+                updated += batch_updated
+                batch = []
+                self.stdout.write(f"{self.model.__name__}: {created + updated + self.errors}/{total}, "
+                                  f"created {created}, updated {updated}")
+
+        if batch:
+            batch_created, batch_updated = self.flush(batch)
+            created += batch_created
+            updated += batch_updated
+        self.stdout.write(self.style.SUCCESS(f"{self.model.__name__}: created {created}, updated {updated}, "
+                                             f"skipped {self.errors}"))
+
+    def get_mapping(self, model: str, source_layer, pairs) -> dict[str, str]:
+        definition = source_layer.GetLayerDefn()
+        source_fields = {}
+        for i in range(definition.GetFieldCount()):
+            source_name = definition.GetFieldDefn(i).GetName()
+            source_fields[source_name.lower()] = source_name
+
+        # По умолчанию поле модели берётся из атрибута с тем же именем
+        mapping = {}
+        for field in MODEL_FIELDS[model]:
+            if field in source_fields:
+                mapping[field] = source_fields[field]
+
+        for pair in pairs:
+            field, _, source_name = pair.partition("=")
+            if field not in MODEL_FIELDS[model]:
+                raise CommandError(f"unknown field {field}, available: {', '.join(MODEL_FIELDS[model])}")
+            if source_name.lower() not in source_fields:
+                raise CommandError(f"source field {source_name} not found")
+            mapping[field] = source_fields[source_name.lower()]
+
+        if "name" not in mapping:
+            raise CommandError("name field is not mapped, use --map name=SOURCE")
+        if "country" in MODEL_FIELDS[model] and "country" not in mapping:
+            raise CommandError("country field is not mapped, use --map country=SOURCE")
+        return mapping
+
+    @staticmethod
+    def get_transform(source_layer):
+        source_srs = source_layer.GetSpatialRef()
+        target_srs = osr.SpatialReference()
+        target_srs.ImportFromEPSG(4326)
+        target_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        if source_srs is None or source_srs.IsSame(target_srs):
+            return None
+        source_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        return osr.CoordinateTransformation(source_srs, target_srs)
+
+    def report(self, fid, error: str):
+        self.errors += 1
+        if self.errors <= MAX_REPORTED_ERRORS:
+            self.stderr.write(f"feature {fid}: {error}")
+
+    def get_values(self, feature):
+        geometry = feature.GetGeometryRef()
+        if geometry is None:
+            return None, "empty geometry"
+
+        geometry = geometry.Clone()
+        if self.transform is not None:
+            geometry.Transform(self.transform)
+        geometry.FlattenTo2D()
+
+        if geometry.GetGeometryType() == ogr.wkbMultiPolygon:
+            if geometry.GetGeometryCount() == 1 or self.largest_part:
+                geometry = max((geometry.GetGeometryRef(i) for i in range(geometry.GetGeometryCount())),
+                               key=lambda part: part.GetArea())
+            else:
+                return None, "geom is a MultiPolygon, use --largest-part"
+
+        values = {"coordinates": GEOSGeometry(memoryview(geometry.ExportToWkb()), srid=4326)}
+        for field, source_name in self.mapping.items():
+            values[field] = feature.GetField(source_name)
+
+        if "description" in MODEL_FIELDS[self.model._meta.model_name]:
+            values["description"] = values.get("description") or ""
+
+        if "country" in values:
+            country = values.pop("country")
+            # Страна задаётся либо id, либо названием
+            country_id = country if isinstance(country, int) else self.countries.get(country)
+            if country_id not in self.country_ids:
+                return None, f"country {country} not found"
+            values["country_id"] = country_id
+
+        if not values["name"]:
+            return None, "empty name"
+        return values, None
+
+    def flush(self, batch) -> (int, int):
+        # Геометрии пачки проверяются вместе, см. validate_polygons
+        polygons, polygon_errors = validate_polygons([values["coordinates"] for _, values in batch], self.make_valid)
+        objs = []
+        # Один ключ дважды в одном INSERT ... ON CONFLICT DO UPDATE - ошибка, поэтому повторы отсекаются
+        # в пределах пачки; с объектами прошлых пачек конфликт разрешает сам ON CONFLICT
+        keys = set()
+        for (fid, values), polygon, error in zip(batch, polygons, polygon_errors):
+            if error is not None:
+                self.report(fid, error)
+                continue
+            values["coordinates"] = polygon
+            obj = self.model(**values)
+            if self.upsert:
+                key = get_natural_key(obj, self.key_attnames)
+                if key in keys:
+                    self.report(fid, f"duplicate {', '.join(self.natural_key)}")
+                    continue
+                keys.add(key)
+            objs.append(obj)
+
+        # bulk_create GeoQuerySet сразу пересчитывает area и упрощённые геометрии для пачки
+        with transaction.atomic():
+            if not self.upsert:
+                return len(self.model.objects.bulk_create(objs)), 0
+            # INSERT ... ON CONFLICT по натуральному ключу, как в bulk эндпоинте
+            created, updated = upsert(self.model, objs, self.natural_key, self.update_fields)
+        return len(created), len(updated)
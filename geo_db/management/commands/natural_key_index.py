@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from geo_db.additional_modules.bulk import NATURAL_KEYS, create_unique_index
+from geo_db.models import Country, City, Capital
+
+MODELS = {
+    "country": Country,
+    "city": City,
+    "capital": Capital,
+}
+
+
+class Command(BaseCommand):
+    help = "Создаёт уникальные индексы на натуральные ключи для bulk эндпоинтов и import_geo --upsert"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", choices=MODELS.keys(), action="append",
+                            help="модель, по умолчанию все")
+
+    def handle(self, *args, model=None, **options):
+        for name in model or MODELS.keys():
+            try:
+                index = create_unique_index(MODELS[name], NATURAL_KEYS[name])
+            except ValueError as e:
+                raise CommandError(f"{e}. Resolve the duplicates and run the command again")
+            self.stdout.write(self.style.SUCCESS(f"{MODELS[name].__name__}: {index}"))
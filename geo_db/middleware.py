@@ -0,0 +1,85 @@
+import json
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from geo_db.additional_modules.metrics import (RequestMetrics, activate, finish_request, get_log_record, observe,
+                                               start_request)
+
+logger = logging.getLogger("geo_db.metrics")
+
+
+class PerformanceMiddleware:
+    # SQL, этапы ответа и размер тела запроса: заголовок Server-Timing, строка JSON в лог
+    # (METRICS_LOG) и гистограммы по маршрутам для /metrics (additional_modules/metrics.py)
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        metrics, token = start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            finish_request(token)
+        return self.process_response(request, response, metrics)
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+
+        metrics, token = start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            finish_request(token)
+        return self.process_response(request, response, metrics)
+
+    def process_response(self, request, response, metrics: RequestMetrics):
+        if request.resolver_match is not None:
+            metrics.route = request.resolver_match.view_name
+        response["Server-Timing"] = metrics.server_timing()
+
+        if not response.streaming:
+            self.record(request, response, metrics, len(response.content))
+        elif getattr(response, "file_to_stream", None) is not None:
+            # FileResponse не оборачивается, иначе пропадает отдача через wsgi.file_wrapper / sendfile
+            self.record(request, response, metrics, int(response.get("Content-Length", 0)))
+        elif not response.is_async:
+            # Время и размер потоковой отдачи известны только после последнего чанка
+            # Исходный итератор берётся до замены: сеттер streaming_content сразу вызывает iter()
+            content = iter(response.streaming_content)
+            response.streaming_content = self.iter_stream(request, response, metrics, content)
+        else:
+            self.record(request, response, metrics, 0)
+        return response
+
+    def iter_stream(self, request, response, metrics: RequestMetrics, content):
+        payload_bytes = 0
+        while True:
+            # Запросы к БД и сериализация чанка учитываются в метриках этого запроса
+            with activate(metrics):
+                chunk = next(content, None)
+            if chunk is None:
+                break
+            payload_bytes += len(chunk)
+            yield chunk
+        self.record(request, response, metrics, payload_bytes)
+
+    @staticmethod
+    def record(request, response, metrics: RequestMetrics, payload_bytes: int):
+        duration = metrics.elapsed()
+        observe(metrics, duration, payload_bytes)
+        if settings.METRICS_LOG:
+            logger.info(json.dumps(get_log_record(request, response, metrics, duration, payload_bytes)))
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.4 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("geo_db", "0002_alter_photo_image"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="capital",
+            name="area",
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="city",
+            name="area",
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="country",
+            name="area",
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True),
+        ),
+    ]
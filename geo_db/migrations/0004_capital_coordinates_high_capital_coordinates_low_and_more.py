@@ -0,0 +1,76 @@
+# Generated by Django 5.0.4 on 2026-10-18 11:03
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("geo_db", "0003_capital_area_city_area_country_area"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="capital",
+            name="coordinates_high",
+            field=django.contrib.gis.db.models.fields.PolygonField(
+                blank=True, editable=False, null=True, srid=4326
+            ),
+        ),
+        migrations.AddField(
+            model_name="capital",
+            name="coordinates_low",
+            field=django.contrib.gis.db.models.fields.PolygonField(
+                blank=True, editable=False, null=True, srid=4326
+            ),
+        ),
+        migrations.AddField(
+            model_name="capital",
+            name="coordinates_medium",
+            field=django.contrib.gis.db.models.fields.PolygonField(
+                blank=True, editable=False, null=True, srid=4326
+            ),
+        ),
+        migrations.AddField(
+            model_name="city",
+            name="coordinates_high",
+            field=django.contrib.gis.db.models.fields.PolygonField(
+                blank=True, editable=False, null=True, srid=4326
+            ),
+        ),
+        migrations.AddField(
+            model_name="city",
+            name="coordinates_low",
+            field=django.contrib.gis.db.models.fields.PolygonField(
+                blank=True, editable=False, null=True, srid=4326
+            ),
+        ),
+        migrations.AddField(
+            model_name="city",
+            name="coordinates_medium",
+            field=django.contrib.gis.db.models.fields.PolygonField(
+                blank=True, editable=False, null=True, srid=4326
+            ),
+        ),
+        migrations.AddField(
+            model_name="country",
+            name="coordinates_high",
+            field=django.contrib.gis.db.models.fields.PolygonField(
+                blank=True, editable=False, null=True, srid=4326
+            ),
+        ),
+        migrations.AddField(
+            model_name="country",
+            name="coordinates_low",
+            field=django.contrib.gis.db.models.fields.PolygonField(
+                blank=True, editable=False, null=True, srid=4326
+            ),
+        ),
+        migrations.AddField(
+            model_name="country",
+            name="coordinates_medium",
+            field=django.contrib.gis.db.models.fields.PolygonField(
+                blank=True, editable=False, null=True, srid=4326
+            ),
+        ),
+    ]
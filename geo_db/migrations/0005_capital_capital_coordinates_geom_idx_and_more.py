@@ -0,0 +1,33 @@
+# Generated by Django 5.0.4 on 2026-10-18 12:21
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+import geo_db.models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("geo_db", "0004_capital_coordinates_high_capital_coordinates_low_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="capital",
+            index=django.contrib.postgres.indexes.GistIndex(
+                geo_db.models.AsGeometry("coordinates"), name="capital_coordinates_geom_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="city",
+            index=django.contrib.postgres.indexes.GistIndex(
+                geo_db.models.AsGeometry("coordinates"), name="city_coordinates_geom_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="country",
+            index=django.contrib.postgres.indexes.GistIndex(
+                geo_db.models.AsGeometry("coordinates"), name="country_coordinates_geom_idx"
+            ),
+        ),
+    ]
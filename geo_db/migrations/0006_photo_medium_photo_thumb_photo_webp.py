@@ -0,0 +1,27 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("geo_db", "0005_capital_capital_coordinates_geom_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="photo",
+            name="medium",
+            field=models.ImageField(blank=True, editable=False, upload_to="media/derivatives/"),
+        ),
+        migrations.AddField(
+            model_name="photo",
+            name="thumb",
+            field=models.ImageField(blank=True, editable=False, upload_to="media/derivatives/"),
+        ),
+        migrations.AddField(
+            model_name="photo",
+            name="webp",
+            field=models.ImageField(blank=True, editable=False, upload_to="media/derivatives/"),
+        ),
+    ]
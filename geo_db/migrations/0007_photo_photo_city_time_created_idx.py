@@ -0,0 +1,16 @@
+# Generated by Django 5.0.4 on 2026-10-18 14:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("geo_db", "0006_photo_medium_photo_thumb_photo_webp"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="photo",
+            index=models.Index(fields=["city", "time_created"], name="photo_city_time_created_idx"),
+        ),
+    ]
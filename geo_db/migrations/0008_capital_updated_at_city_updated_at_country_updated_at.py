@@ -0,0 +1,37 @@
+# Generated by Django 5.0.4 on 2026-10-18 15:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("geo_db", "0007_photo_photo_city_time_created_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="capital",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, db_index=True, default=django.utils.timezone.now, null=True
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="city",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, db_index=True, default=django.utils.timezone.now, null=True
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="country",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, db_index=True, default=django.utils.timezone.now, null=True
+            ),
+            preserve_default=False,
+        ),
+    ]
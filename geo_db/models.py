@@ -2,27 +2,86 @@ import base64
 import uuid
 
 from django.contrib.gis.db import models
+from django.contrib.gis.db.models.functions import Area
+from django.contrib.postgres.indexes import GistIndex
 from django.core.files.base import ContentFile
+from django.db.models import Func, Value
+from django.db.models.functions import Cast, Now
 from osgeo import ogr
 from pyproj import Transformer
 
+from geo_db.additional_modules.cache import bump_version
+from geo_db.additional_modules.derivatives import DERIVATIVES, DERIVATIVES_DIR
+from geo_db.additional_modules.geometry import LEVELS_OF_DETAIL
+
+
+class SimplifyPreserveTopology(Func):
+    function = "ST_SimplifyPreserveTopology"
+    output_field = models.PolygonField(srid=4326)
+
+
+class AsGeometry(Func):
+    template = "(%(expressions)s)::geometry"
+    output_field = models.GeometryField(srid=4326)
+
+
+class GeoQuerySet(models.QuerySet):
+    def update_computed_fields(self):
+        geometry = Cast("coordinates", models.PolygonField(srid=4326))
+        values = {"area": Cast(Area("coordinates"), models.FloatField()), "updated_at": Now()}
+        for field, tolerance in LEVELS_OF_DETAIL:
+            values[field] = SimplifyPreserveTopology(geometry, Value(tolerance))
+        return super().update(**values)
+
+    def update(self, **kwargs):
+        kwargs.setdefault("updated_at", Now())
+        # Массовые операции не отправляют post_save, версия кэша ответов увеличивается здесь
+        if "coordinates" not in kwargs:
+            rows = super().update(**kwargs)
+            bump_version(self.model)
+            return rows
+
+        pks = list(self.values_list("pk", flat=True))
+        rows = super().update(**kwargs)
+        self.model.objects.filter(pk__in=pks).update_computed_fields()
+        bump_version(self.model)
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        pks = [obj.pk for obj in objs if obj.pk is not None]
+        self.model.objects.filter(pk__in=pks).update_computed_fields()
+        bump_version(self.model)
+        return objs
 
 
 class GeoModel(models.Model):
-    objects = models.Manager()
+    objects = GeoQuerySet.as_manager()
 
     class Meta:
         abstract = True
+        indexes = [
+            # Для предикатов, которые PostGIS считает только по geometry (within)
+            GistIndex(AsGeometry("coordinates"), name="%(class)s_coordinates_geom_idx"),
+        ]
 
     name = models.CharField(max_length=255)
     coordinates = models.PolygonField(srid=4326, geography=True)
+    # Площадь в квадратных метрах, пересчитывается при изменении coordinates
+    area = models.FloatField(null=True, blank=True, editable=False, db_index=True)
+    # Упрощённые копии coordinates для ответов с ?zoom / ?simplify, см. LEVELS_OF_DETAIL
+    coordinates_low = models.PolygonField(srid=4326, null=True, blank=True, editable=False)
+    coordinates_medium = models.PolygonField(srid=4326, null=True, blank=True, editable=False)
+    coordinates_high = models.PolygonField(srid=4326, null=True, blank=True, editable=False)
+    # Для ETag / Last-Modified, обновляется также массовыми операциями GeoQuerySet
+    updated_at = models.DateTimeField(auto_now=True, null=True, db_index=True)
 
     def __str__(self):
         return f"Name: {self.name}"
 
 
 class Country(GeoModel):
-    class Meta:
+    class Meta(GeoModel.Meta):
         verbose_name = "Страна"
         verbose_name_plural = "Страны"
 
@@ -31,7 +90,7 @@ class City(GeoModel):
     description = models.TextField()
     country = models.ForeignKey("Country", on_delete=models.CASCADE)
 
-    class Meta:
+    class Meta(GeoModel.Meta):
         verbose_name = "Город"
         verbose_name_plural = "Города"
 
@@ -39,7 +98,7 @@ class City(GeoModel):
 class Capital(GeoModel):
     country = models.OneToOneField("Country", on_delete=models.CASCADE)
 
-    class Meta:
+    class Meta(GeoModel.Meta):
         verbose_name = "Столица"
         verbose_name_plural = "Столицы"
 
@@ -48,6 +107,15 @@ class Photo(models.Model):
     image = models.ImageField(upload_to="media/")
     time_created = models.DateTimeField(auto_now_add=True)
     city = models.ForeignKey("City", on_delete=models.CASCADE, related_name='images')
+    # Производные изображения, создаются в фоне после загрузки (см. additional_modules/derivatives.py)
+    thumb = models.ImageField(upload_to=DERIVATIVES_DIR, blank=True, editable=False)
+    medium = models.ImageField(upload_to=DERIVATIVES_DIR, blank=True, editable=False)
+    webp = models.ImageField(upload_to=DERIVATIVES_DIR, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["city", "time_created"], name="photo_city_time_created_idx"),
+        ]
 
     def __init__(self, *args, base64_image: str = None, **kwargs):
         super().__init__(*args, **kwargs)
@@ -58,8 +126,16 @@ class Photo(models.Model):
         image_data = base64.b64decode(base64_image)
         return ContentFile(image_data, name=self.__get_new_image_name())
 
-    def get_image_base64(self):
-        with self.image.open(mode='rb') as img_file:
+    def get_image(self, size: str = None):
+        # Если производное изображение ещё не готово, отдаётся оригинал
+        if size is not None:
+            derivative = getattr(self, size)
+            if derivative:
+                return derivative
+        return self.image
+
+    def get_image_base64(self, size: str = None):
+        with self.get_image(size).open(mode='rb') as img_file:
             img_data = img_file.read()
 
         return base64.b64encode(img_data).decode('utf-8')
@@ -70,4 +146,6 @@ class Photo(models.Model):
     def delete(self, *args, **kwargs):
         # Удаление связанного файла перед удалением объекта
         self.image.delete()
+        for size in DERIVATIVES:
+            getattr(self, size).delete()
         super().delete(*args, **kwargs)
@@ -0,0 +1,81 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+
+from geo_db.additional_modules.fastjson import FragmentJSONEncoder, dumps
+from geo_db.additional_modules.metrics import timer
+
+
+class FastJSONRenderer(JSONRenderer):
+    # orjson (если установлен) и вставка готовых фрагментов геометрии, см. additional_modules/fastjson.py
+    encoder_class = FragmentJSONEncoder
+    # Геометрия передаётся JSONFragment, см. get_serializer_context во views
+    supports_fragments = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        with timer("render"):
+            # Отступы нужны только browsable API, там используется стандартный json
+            if self.get_indent(accepted_media_type, renderer_context or {}):
+                return super().render(data, accepted_media_type, renderer_context)
+            return dumps(data)
+
+
+class PassthroughRenderer(BaseRenderer):
+    # Тело ответа формирует view, рендерер нужен для выбора формата по ?format= / Accept
+    # и для ошибок, которые отдаются как JSON
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Ошибки отдаются JSON рендерером из настроек (JSON_RENDERER)
+        json_renderer = next(renderer for renderer in api_settings.DEFAULT_RENDERER_CLASSES
+                             if issubclass(renderer, JSONRenderer))
+        return json_renderer().render(data, renderer_context=renderer_context)
+
+
+class NDJSONRenderer(PassthroughRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+
+class GeoPackageRenderer(PassthroughRenderer):
+    media_type = "application/geopackage+sqlite3"
+    format = "gpkg"
+
+
+class GeometryRenderer(PassthroughRenderer):
+    # Формат записей см. additional_modules/binary.py
+    pass
+
+
+# Для списков и объектов - страница в FlatGeobuf, для export - вся выборка
+class FlatGeobufRenderer(GeometryRenderer):
+    media_type = "application/flatgeobuf"
+    format = "fgb"
+
+
+EXPORT_RENDERERS = [NDJSONRenderer, GeoPackageRenderer, FlatGeobufRenderer]
+
+
+class WKBRenderer(GeometryRenderer):
+    media_type = "application/vnd.geo-db.wkb"
+    format = "wkb"
+
+
+class EWKBRenderer(GeometryRenderer):
+    media_type = "application/vnd.geo-db.ewkb"
+    format = "ewkb"
+
+
+class TWKBRenderer(GeometryRenderer):
+    media_type = "application/vnd.geo-db.twkb"
+    format = "twkb"
+
+
+class GeoJSONSeqRenderer(GeometryRenderer):
+    # RFC 8142: каждая Feature начинается с RS и заканчивается переводом строки
+    media_type = "application/geo+json-seq"
+    format = "geojsonseq"
+
+
+GEOMETRY_RENDERERS = [GeoJSONSeqRenderer, WKBRenderer, EWKBRenderer, TWKBRenderer, FlatGeobufRenderer]
@@ -1,41 +1,79 @@
 import json
 
-from django.contrib.gis.db.models.functions import Area
-from django.contrib.gis.geos import GEOSGeometry, Polygon
+from django.conf import settings
+from django.contrib.gis.db.models.functions import Centroid, Envelope
 from django.core.exceptions import ValidationError
-from django.db.models import QuerySet
+from django.db.models import Count, F, QuerySet, Sum
+from django.db.models.functions import Coalesce
+from osgeo import ogr
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
 
+from geo_db.additional_modules.binary import encode_record, geometry_bytes
+from geo_db.additional_modules.blocking import run_blocking
+from geo_db.additional_modules.export import iter_ogr
+from geo_db.additional_modules.fastjson import JSONFragment, dumps
+from geo_db.additional_modules.geojson import feature_json, properties_json
+from geo_db.additional_modules.geometry import GeometryOptions, LEVELS_OF_DETAIL
+from geo_db.additional_modules.metrics import timer
 from geo_db.additional_modules.pagination import Paginator
-from geo_db.models import Country, City, Capital, GeoModel
+from geo_db.additional_modules.validation import validate_polygons
+from geo_db.additional_modules.derivatives import DERIVATIVES
+from geo_db.models import AsGeometry, Country, City, Capital, GeoModel, Photo
+
+# ?geometry=bbox/centroid: функция PostGIS и атрибут GEOS, если аннотация не рассчитана
+GEOMETRY_SUMMARY = {
+    "bbox": (Envelope, "envelope"),
+    "centroid": (Centroid, "centroid"),
+}
 
 
 class GeoSerializerModel(serializers.ModelSerializer):
     area = serializers.SerializerMethodField()
 
     def validate_coordinates(self, value):
-        try:
-            polygon = GEOSGeometry(value)
-        except Exception as e:
-            raise ValidationError([str(e)])
+        # При массовой загрузке геометрии проверяются одним пакетом (additional_modules/bulk.py)
+        if self.context.get("upsert"):
+            return value
+
+        polygons, errors = validate_polygons([value], settings.GEOMETRY_MAKE_VALID)
+        if errors[0] is not None:
+            raise ValidationError([errors[0]])
+        return polygons[0]
 
-        if not isinstance(polygon, Polygon):
-            raise ValidationError(["geom must be a Polygon"])
+    def get_fields(self):
+        fields = super().get_fields()
+        # Геометрия выводится отдельно (get_geometry_json), в properties не попадает
+        if "coordinates" in fields:
+            fields["coordinates"].write_only = True
+        # ?fields=: остальные свойства не читаются при выводе, но остаются доступны для записи
+        options: GeometryOptions = self.context.get("geometry")
+        if options is not None and options.fields is not None:
+            for name, field in fields.items():
+                if name != "id" and name not in options.fields:
+                    field.write_only = True
+        if not self.context.get("upsert"):
+            return fields
 
-        if not polygon.valid:
-            raise ValidationError([f"geom is not a valid polygon: {polygon.valid_reason}"])
+        # Массовая загрузка: конфликты по натуральному ключу разрешает upsert,
+        # существование связанных объектов проверяется одним запросом (additional_modules/bulk.py)
+        for name, field in fields.items():
+            field.validators = [v for v in field.validators if not isinstance(v, UniqueValidator)]
+            if isinstance(field, serializers.PrimaryKeyRelatedField):
+                fields[name] = serializers.IntegerField(source=self.Meta.model._meta.get_field(name).attname)
+        return fields
 
-        for coord in polygon.coords[0]:
-            if not (-180.0 <= coord[0] <= 180.0 and -90.0 <= coord[1] <= 90.0):
-                raise ValidationError([
-                    "Coordinates out of range: longitude must be between -180 and 180, latitude must be between -90 and 90"])
-        return polygon
+    def get_validators(self):
+        if self.context.get("upsert"):
+            return []
+        return super().get_validators()
 
     def get_area(self, obj):
-        area = getattr(obj, 'area', None)
-        if area is None:
+        request = self.context.get("request")
+        options: GeometryOptions = self.context.get("geometry") or GeometryOptions({})
+        if request is None or not options.include_area(request.query_params):
             return None
-        return area.sq_m
+        return obj.area
 
     def to_representation(self, instance: GeoModel | list[GeoModel]):
         if isinstance(instance, (list, QuerySet)):
@@ -55,14 +93,103 @@ class GeoSerializerModel(serializers.ModelSerializer):
             if atr not in ["id", "coordinates"] and serialize_data[atr] is not None:
                 proprieties[atr] = serialize_data[atr]
 
+        geometry = self.get_geometry_json(instance)
+        if geometry is not None:
+            # Во view геометрия не разбирается обратно, рендерер вставляет строку как есть
+            geometry = JSONFragment(geometry) if self.context.get("json_fragments") else json.loads(geometry)
         result = {
             "type": "Feature",
-            "geometry": json.loads(instance.coordinates.json),
+            "geometry": geometry,
             "id": instance.pk,
             "properties": proprieties
         }
         return result
 
+    def get_geometry_json(self, instance):
+        with timer("geometry"):
+            return self._get_geometry_json(instance)
+
+    def _get_geometry_json(self, instance):
+        options: GeometryOptions = self.context.get("geometry")
+        if options is None:
+            return instance.coordinates.json
+        if options.geometry == "none":
+            return None
+
+        if options.geometry == "full" and options.field == "coordinates":
+            geometry = instance.coordinates
+        elif options.geometry == "full":
+            # Уровень детализации или полная геометрия, если он не рассчитан: Coalesce в project_queryset
+            geometry = getattr(instance, "geometry_lod", None)
+            if geometry is None:
+                geometry = getattr(instance, options.field) or instance.coordinates
+        else:
+            # bbox и центроид считаются в PostGIS (project_queryset), без аннотации - через GEOS
+            geometry = getattr(instance, "geometry_summary", None)
+            if geometry is None:
+                geometry = getattr(instance.coordinates, GEOMETRY_SUMMARY[options.geometry][1])
+        if options.precision is None:
+            return geometry.json
+        geometry = ogr.CreateGeometryFromWkb(bytes(geometry.wkb))
+        return geometry.ExportToJson([f"COORDINATE_PRECISION={options.precision}"])
+
+    @classmethod
+    def get_property_fields(cls, options: GeometryOptions) -> list:
+        properties = [atr for atr in cls.Meta.fields if atr not in ["id", "coordinates"]]
+        if options.fields is None:
+            return properties
+
+        unknown = options.fields.difference(properties)
+        if len(unknown) != 0:
+            raise serializers.ValidationError({"detail": f"fields in {tuple(properties)}"})
+        return [atr for atr in properties if atr in options.fields]
+
+    @classmethod
+    def get_geometry_source(cls, options: GeometryOptions):
+        # Поле модели, выражение PostGIS для bbox/центроида или None без геометрии
+        if options.geometry == "none":
+            return None
+        if options.geometry == "full":
+            return options.field
+        return GEOMETRY_SUMMARY[options.geometry][0](AsGeometry("coordinates"))
+
+    @classmethod
+    def project_queryset(cls, queryset, options: GeometryOptions):
+        # Из базы читаются только колонки, нужные ответу: один уровень детализации,
+        # без полигона для ?geometry=bbox/centroid/none и без свойств, не указанных в ?fields=
+        property_fields = cls.get_property_fields(options)
+        deferred = [field for field, _ in LEVELS_OF_DETAIL]
+        if options.geometry != "full" or options.field != "coordinates":
+            deferred.append("coordinates")
+        deferred += [atr for atr in cls.Meta.fields if atr not in ["id", "coordinates"] and atr not in property_fields]
+
+        if options.geometry == "full" and options.field != "coordinates":
+            # Полная геометрия читается, только если уровень детализации не рассчитан
+            queryset = queryset.annotate(geometry_lod=Coalesce(AsGeometry(options.field), AsGeometry("coordinates")))
+        elif options.geometry in GEOMETRY_SUMMARY:
+            queryset = queryset.annotate(geometry_summary=cls.get_geometry_source(options))
+        return queryset.defer(*deferred)
+
+    @classmethod
+    def get_properties_expressions(cls, model, query_params, options: GeometryOptions) -> dict:
+        properties = {}
+        for atr in cls.get_property_fields(options):
+            if atr == "area" and not options.include_area(query_params):
+                continue
+            properties[atr] = F(model._meta.get_field(atr).attname)
+        return properties
+
+    @classmethod
+    def annotate_feature_json(cls, queryset, query_params, options: GeometryOptions):
+        properties = cls.get_properties_expressions(queryset.model, query_params, options)
+        return queryset.annotate(feature_json=feature_json(cls.get_geometry_source(options), F("pk"), properties,
+                                                           options.precision))
+
+    @classmethod
+    def annotate_properties_json(cls, queryset, query_params, options: GeometryOptions):
+        properties = cls.get_properties_expressions(queryset.model, query_params, options)
+        return queryset.annotate(properties_json=properties_json(properties))
+
 
 class CountySerializer(GeoSerializerModel):
     class Meta:
@@ -82,17 +209,202 @@ class CapitalSerializer(GeoSerializerModel):
         fields = ("id", "name", "coordinates", "area", "country")
 
 
+class PhotoSerializer(serializers.ModelSerializer):
+    sizes = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Photo
+        fields = ("id", "time_created", "sizes")
+
+    def get_sizes(self, obj):
+        return [size for size in DERIVATIVES if getattr(obj, size)]
+
+
 class DataCollectionSerializer:
     @classmethod
     def get_feature_collection(cls, queryset, serializer, serializer_context, paginator: Paginator, query_params):
-        count_data = queryset.count()
-        instances = queryset[paginator.get_start():paginator.get_end()]
+        count_data, total_area = cls.get_aggregates(queryset, paginator, query_params)
+        instances = list(paginator.paginate_queryset(queryset))
+        if len(instances) != 0:
+            paginator.set_page_bounds(instances[0].pk, instances[-1].pk, len(instances))
 
-        feature_collection = serializer(instances, context=serializer_context).data
+        with timer("serialize"):
+            feature_collection = serializer(instances, context=serializer_context).data
 
         if "total_area" in query_params:
-            total_area = sum([obj.area.sq_m for obj in instances])
             feature_collection["total_area"] = total_area
 
         feature_collection.update(paginator.get_pagination_data(count_data))
         return feature_collection
+
+    @classmethod
+    def get_aggregates(cls, queryset, paginator: Paginator, query_params):
+        with timer("aggregate"):
+            return cls._get_aggregates(queryset, paginator, query_params)
+
+    @classmethod
+    def _get_aggregates(cls, queryset, paginator: Paginator, query_params):
+        # total_area=all - площадь всей отфильтрованной выборки, иначе только текущей страницы
+        if query_params.get("total_area") == "all":
+            aggregates = queryset.aggregate(count=Count("pk"), total_area=Sum("area"))
+            return aggregates["count"], aggregates["total_area"] or 0
+
+        count_data = queryset.count()
+        if "total_area" not in query_params:
+            return count_data, None
+        page = paginator.paginate_queryset(queryset)
+        return count_data, page.aggregate(total_area=Sum("area"))["total_area"] or 0
+
+    @classmethod
+    def stream_feature_collection(cls, queryset, serializer, serializer_context, paginator: Paginator, query_params):
+        # Фичи отдаются по одной, count, ссылки пагинации и total_area уходят в конец ответа
+        if settings.GEOJSON_FROM_DATABASE:
+            features = cls._iter_database_features(queryset, serializer, serializer_context, paginator, query_params)
+        else:
+            features = cls._iter_python_features(queryset, serializer, serializer_context, paginator)
+
+        yield b'{"type":"FeatureCollection","features":['
+        first_pk, last_pk, page_size = None, None, 0
+        for feature, pk in features:
+            if page_size != 0:
+                yield b","
+            yield feature
+            if first_pk is None:
+                first_pk = pk
+            last_pk = pk
+            page_size += 1
+
+        if page_size != 0:
+            paginator.set_page_bounds(first_pk, last_pk, page_size)
+        count_data, total_area = cls.get_aggregates(queryset, paginator, query_params)
+        yield cls.get_trailer(count_data, total_area, paginator, query_params)
+
+    @classmethod
+    def encode_page(cls, queryset, serializer, serializer_context, paginator: Paginator | None, query_params,
+                    encoding: str) -> (bytes, list):
+        # Страница в формате GeoJSON-seq, FlatGeobuf или записей WKB/EWKB/TWKB (additional_modules/binary.py)
+        paginate = paginator.paginate_queryset if paginator is not None else (lambda page: page)
+        options = serializer_context.get("geometry") or GeometryOptions({})
+
+        if encoding == "fgb":
+            pks = list(paginate(queryset).values_list("pk", flat=True))
+            page = queryset.model.objects.filter(pk__in=pks)
+            return b"".join(iter_ogr(page, serializer, encoding, queryset.model._meta.model_name)), pks
+
+        if encoding == "geojsonseq" and settings.GEOJSON_FROM_DATABASE:
+            rows = paginate(serializer.annotate_feature_json(queryset, query_params, options)
+                            .values_list("feature_json", "pk"))
+            records = [(b"\x1e" + feature.encode("utf-8") + b"\n", pk) for feature, pk in rows]
+        elif encoding == "geojsonseq":
+            feature_serializer = serializer(context=cls.get_encode_context(serializer_context))
+            records = [(b"\x1e" + cls.encode(feature_serializer.to_representation(obj)) + b"\n", obj.pk)
+                       for obj in paginate(queryset)]
+        else:
+            rows = paginate(serializer.annotate_properties_json(queryset, query_params, options)
+                            .annotate(geometry_bytes=geometry_bytes(encoding, serializer.get_geometry_source(options),
+                                                                    options))
+                            .values_list("pk", "properties_json", "geometry_bytes"))
+            records = [(encode_record(pk, properties, geometry), pk) for pk, properties, geometry in rows]
+        return b"".join(record for record, _ in records), [pk for _, pk in records]
+
+    @classmethod
+    def get_encoded_collection(cls, queryset, serializer, serializer_context, paginator: Paginator, query_params,
+                               encoding: str) -> (bytes, dict):
+        # count, total_area и ссылки пагинации передаются в заголовках
+        content, pks = cls.encode_page(queryset, serializer, serializer_context, paginator, query_params, encoding)
+        if len(pks) != 0:
+            paginator.set_page_bounds(pks[0], pks[-1], len(pks))
+        count_data, total_area = cls.get_aggregates(queryset, paginator, query_params)
+
+        headers = {"X-Total-Count": str(count_data)}
+        if "total_area" in query_params:
+            headers["X-Total-Area"] = str(total_area)
+        previous_link, next_link = paginator.get_links_pagination(count_data)
+        links = [f'<{link}>; rel="{rel}"' for rel, link in (("prev", previous_link), ("next", next_link))
+                 if link is not None]
+        if len(links) != 0:
+            headers["Link"] = ", ".join(links)
+        return content, headers
+
+    @classmethod
+    def get_trailer(cls, count_data, total_area, paginator: Paginator, query_params) -> bytes:
+        trailer = {}
+        if "total_area" in query_params:
+            trailer["total_area"] = total_area
+        trailer.update(paginator.get_pagination_data(count_data))
+        return b"]," + cls.encode(trailer)[1:]
+
+    @classmethod
+    async def aget_feature_collection(cls, queryset, serializer, serializer_context, paginator: Paginator,
+                                      query_params) -> bytes:
+        # Async вариант stream_feature_collection: запросы через async ORM, GEOS в пуле потоков
+        if settings.GEOJSON_FROM_DATABASE:
+            options = serializer_context.get("geometry") or GeometryOptions({})
+            queryset_json = serializer.annotate_feature_json(queryset, query_params, options)
+            instances = paginator.paginate_queryset(queryset_json.values_list("feature_json", "pk"))
+            features = [(feature.encode("utf-8"), pk) async for feature, pk in instances]
+        else:
+            instances = [obj async for obj in paginator.paginate_queryset(queryset)]
+            features = await run_blocking(cls._encode_features, instances, serializer, serializer_context)
+
+        if len(features) != 0:
+            paginator.set_page_bounds(features[0][1], features[-1][1], len(features))
+        count_data, total_area = await cls.aget_aggregates(queryset, paginator, query_params)
+        return b"".join([b'{"type":"FeatureCollection","features":[',
+                         b",".join(feature for feature, _ in features),
+                         cls.get_trailer(count_data, total_area, paginator, query_params)])
+
+    @classmethod
+    async def aget_aggregates(cls, queryset, paginator: Paginator, query_params):
+        with timer("aggregate"):
+            return await cls._aget_aggregates(queryset, paginator, query_params)
+
+    @classmethod
+    async def _aget_aggregates(cls, queryset, paginator: Paginator, query_params):
+        if query_params.get("total_area") == "all":
+            aggregates = await queryset.aaggregate(count=Count("pk"), total_area=Sum("area"))
+            return aggregates["count"], aggregates["total_area"] or 0
+
+        count_data = await queryset.acount()
+        if "total_area" not in query_params:
+            return count_data, None
+        page = paginator.paginate_queryset(queryset)
+        return count_data, (await page.aaggregate(total_area=Sum("area")))["total_area"] or 0
+
+    @classmethod
+    def _encode_features(cls, instances, serializer, serializer_context):
+        feature_serializer = serializer(context=cls.get_encode_context(serializer_context))
+        with timer("serialize"):
+            return [(cls.encode(feature_serializer.to_representation(obj)), obj.pk) for obj in instances]
+
+    @classmethod
+    def _iter_python_features(cls, queryset, serializer, serializer_context, paginator: Paginator):
+        instances = paginator.paginate_queryset(queryset)
+        feature_serializer = serializer(context=cls.get_encode_context(serializer_context))
+        for obj in cls.iter_page(instances):
+            with timer("serialize"):
+                feature = cls.encode(feature_serializer.to_representation(obj))
+            yield feature, obj.pk
+
+    @classmethod
+    def _iter_database_features(cls, queryset, serializer, serializer_context, paginator: Paginator, query_params):
+        options = serializer_context.get("geometry") or GeometryOptions({})
+        queryset = serializer.annotate_feature_json(queryset, query_params, options)
+        instances = paginator.paginate_queryset(queryset.values_list("feature_json", "pk"))
+        for feature, pk in cls.iter_page(instances):
+            yield feature.encode("utf-8"), pk
+
+    @staticmethod
+    def iter_page(page):
+        # Потоковая отдача: страница читается именованным серверным курсором пачками,
+        # без буферизации всего результата на стороне клиента
+        return page.iterator(chunk_size=settings.STREAM_CHUNK_SIZE)
+
+    @staticmethod
+    def get_encode_context(serializer_context) -> dict:
+        # Feature кодируются здесь же через encode, рендерер не участвует, фрагменты геометрии допустимы всегда
+        return {**serializer_context, "json_fragments": True}
+
+    @staticmethod
+    def encode(data) -> bytes:
+        return dumps(data)
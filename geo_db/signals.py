@@ -0,0 +1,44 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from geo_db.additional_modules.cache import bump_version
+from geo_db.additional_modules.metrics import execute_wrapper
+from geo_db.additional_modules.derivatives import schedule_derivatives
+from geo_db.models import Country, City, Capital, Photo
+
+
+@receiver(post_save, sender=Country)
+@receiver(post_save, sender=City)
+@receiver(post_save, sender=Capital)
+def update_computed_fields(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and "coordinates" not in update_fields:
+        return
+    sender.objects.filter(pk=instance.pk).update_computed_fields()
+    instance.refresh_from_db(fields=["area"])
+
+
+@receiver(post_save, sender=Photo)
+def create_photo_derivatives(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw and instance.image:
+        schedule_derivatives(instance)
+
+
+# Подключается после пересчёта сохранённых полей, чтобы новая версия не закэшировала старую площадь
+@receiver(post_save, sender=Country)
+@receiver(post_save, sender=City)
+@receiver(post_save, sender=Capital)
+@receiver(post_save, sender=Photo)
+@receiver(post_delete, sender=Country)
+@receiver(post_delete, sender=City)
+@receiver(post_delete, sender=Capital)
+@receiver(post_delete, sender=Photo)
+def invalidate_response_cache(sender, **kwargs):
+    bump_version(sender)
+
+
+# Учёт SQL для метрик запроса (middleware.py), соединение может переподключаться повторно
+@receiver(connection_created)
+def add_metrics_wrapper(sender, connection, **kwargs):
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
@@ -1,7 +1,25 @@
 import base64
-
-from django.contrib.gis.geos import Polygon
-from django.test import TestCase
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.gis.geos import GEOSGeometry, Polygon
+from PIL import Image
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+
+from geo_db import filters
+from geo_db.additional_modules.binary import decode_records
+from geo_db.additional_modules.cache import get_cache
+from geo_db.additional_modules.derivatives import render_derivatives
+from geo_db.additional_modules.geometry import GeometryOptions
+from geo_db.additional_modules.validation import COORDINATES_RANGE_ERROR, validate_polygons
+from geo_db.models import City, Country
+from geo_db.serializers import CitySerializer, CountySerializer
+from geo_db.views import CountryViewSet
 
 TEST_POLYGON = ((19.298488064150035, 43.510902041818866),
                 (19.528309386031935, 43.24686866222709),
@@ -9,7 +27,13 @@ TEST_POLYGON = ((19.298488064150035, 43.510902041818866),
                 (19.298488064150035, 43.510902041818866))
 
 
-class BaseEndpoints(TestCase):
+class GeoTestCase(TestCase):
+    def setUp(self):
+        # Откат транзакции теста не меняет версии кэша ответов
+        get_cache().clear()
+
+
+class BaseEndpoints(GeoTestCase):
     fixtures = ["test_country", ]
 
     def test_format_feature_target_obj(self):
@@ -51,13 +75,35 @@ class BaseEndpoints(TestCase):
         response = self.client.post(url, data=data)
         self.assertEqual(response.status_code, status_code)
 
+    def test_validate_polygons(self):
+        hole = ((0, 0), (0, 10), (200, 10), (200, 0), (0, 0)), ((1, 1), (1, 2), (2, 2), (1, 1))
+        bow_tie = "POLYGON ((0 0, 10 10, 10 0, 0 10, 0 0))"
+        values = [Polygon(TEST_POLYGON).wkt, Polygon(*hole).wkt, bow_tie, "POINT (1 1)", "wrong"]
+        polygons, errors = validate_polygons(values)
+        self.assertIsNone(errors[0])
+        self.assertEqual(polygons[0].coords, Polygon(TEST_POLYGON).coords)
+        self.assertEqual(errors[1], COORDINATES_RANGE_ERROR)
+        self.assertIn("not a valid polygon", errors[2])
+        self.assertEqual(errors[3], "geom must be a Polygon")
+        self.assertIsNotNone(errors[4])
+        self.assertEqual(polygons[1:], [None] * 4)
+
+        polygons, errors = validate_polygons([bow_tie], make_valid=True)
+        self.assertIn("MultiPolygon", errors[0])
+
+        not_a_number = Polygon(((0, 0), (0, float("nan")), (1, 1), (0, 0)))
+        polygons, errors = validate_polygons([not_a_number, "POLYGON EMPTY"], make_valid=True)
+        self.assertIsNotNone(errors[0])
+        self.assertEqual(errors[1], "geom must not be empty")
+        self.assertEqual(polygons, [None, None])
+
     def test_format_wkt_polygon(self):
         self.sup_create_wrong_format_wkt_polygon("Polygon((30 10, 40 40, 20 40, 10 20, 30 10))", 201)
         self.sup_create_wrong_format_wkt_polygon("POLYGON((30 10, 40 40, 20 40, 10 20, 30 10))", 201)
         self.sup_create_wrong_format_wkt_polygon("Polygon((30 10, 40 40, 20 40, 10 20))", 400)
 
 
-class EndpointCountry(TestCase):
+class EndpointCountry(GeoTestCase):
     fixtures = ["test_country", ]
 
     def test_create_countries(self):
@@ -99,6 +145,22 @@ class EndpointCountry(TestCase):
         self.sup_countries_bbox(("serbia", "turkey"), "14.533444941126703 32.43752552067821 46.39631982796453 48.66047888075295")
         self.sup_countries_bbox(("serbia",), "16.65426881144313 41.232741282364515 25.591189909754917 48.07800474300802")
 
+    def test_countries_bbox_predicate(self):
+        bbox = "14.533444941126703 32.43752552067821 46.39631982796453 48.66047888075295"
+        for predicate in ("bbox_overlaps", "intersects", "within"):
+            response = self.client.get(f"/api/countries/?bbox={bbox}&predicate={predicate}")
+            self.assertContains(response, "serbia")
+            self.assertContains(response, "turkey")
+
+        bbox = "20.0 43.0 20.5 43.5"
+        response = self.client.get(f"/api/countries/?bbox={bbox}&predicate=intersects")
+        self.assertContains(response, "serbia")
+        response = self.client.get(f"/api/countries/?bbox={bbox}&predicate=within")
+        self.assertNotContains(response, "serbia")
+
+        response = self.client.get(f"/api/countries/?bbox={bbox}&predicate=touches")
+        self.assertEqual(response.status_code, 400)
+
     def test_get_country_area(self):
         url = "/api/countries/1/?area"
         response = self.client.get(url)
@@ -120,8 +182,360 @@ class EndpointCountry(TestCase):
         response = self.client.get(url)
         self.assertContains(response, "total_area")
 
+    def test_countries_total_area_all(self):
+        response = self.client.get("/api/countries/?area&limit=1&ordering=id")
+        area = response.json()["features"][0]["properties"]["area"]
+
+        response = self.client.get("/api/countries/?total_area&limit=1&ordering=id")
+        self.assertAlmostEqual(response.json()["total_area"], area)
+
+        response = self.client.get("/api/countries/?total_area=all&limit=1")
+        self.assertGreater(response.json()["total_area"], area)
+        self.assertEqual(response.json()["count"], 3)
+
+    def test_countries_stored_area(self):
+        response = self.client.get("/api/countries/?area&ordering=-area")
+        self.assertEqual(response.status_code, 200)
+        areas = [feature["properties"]["area"] for feature in response.json()["features"]]
+        self.assertEqual(len(areas), 3)
+        self.assertEqual(areas, sorted(areas, reverse=True))
+
+        response = self.client.get(f"/api/countries/?area&min_area={areas[1]}")
+        self.assertEqual(len(response.json()["features"]), 2)
+
+    def test_country_zoom_simplify(self):
+        response = self.client.get("/api/countries/3/")
+        full = response.json()["geometry"]["coordinates"][0]
+
+        response = self.client.get("/api/countries/3/?zoom=2")
+        self.assertEqual(response.status_code, 200)
+        simplified = response.json()["geometry"]["coordinates"][0]
+        self.assertLessEqual(len(simplified), len(full))
+
+        response = self.client.get("/api/countries/?simplify=0.1")
+        self.assertEqual(response.status_code, 200)
+
+    def test_country_zoom_fallback(self):
+        # Без рассчитанного уровня детализации отдаётся полная геометрия, подставленная в SQL
+        Country.objects.filter(pk=3).update(coordinates_low=None)
+        country = CountySerializer.project_queryset(Country.objects.filter(pk=3), GeometryOptions({"zoom": "0"}))[0]
+        self.assertIn("coordinates", country.get_deferred_fields())
+        self.assertTrue(country.geometry_lod.equals_exact(Country.objects.get(pk=3).coordinates, 1e-9))
+
+        with override_settings(GEOJSON_FROM_DATABASE=False):
+            full = self.client.get("/api/countries/3/").json()["geometry"]
+            self.assertEqual(self.client.get("/api/countries/3/?zoom=0").json()["geometry"], full)
+
+    def test_countries_precision(self):
+        response = self.client.get("/api/countries/3/?precision=2")
+        self.assertEqual(response.status_code, 200)
+        for lon, lat in response.json()["geometry"]["coordinates"][0]:
+            self.assertEqual(lon, round(lon, 2))
+            self.assertEqual(lat, round(lat, 2))
+
+        response = self.client.get("/api/countries/?precision=50")
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(RESPONSE_CACHE_ENABLED=True)
+    def test_countries_response_cache(self):
+        response = self.client.get("/api/countries/?area")
+        self.assertEqual(response["X-Cache"], "MISS")
+        response = self.client.get("/api/countries/?area")
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertContains(response, "serbia")
+
+        response = self.client.patch("/api/countries/3/", data={"name": "test88"}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get("/api/countries/?area")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertContains(response, "test88")
+        self.assertNotContains(response, "serbia")
+
+    def test_countries_conditional_get(self):
+        for url in ("/api/countries/?area", "/api/countries/3/"):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response["ETag"]
+
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+        # Удаление не меняет max(updated_at), поэтому у списков нет Last-Modified
+        response = self.client.get("/api/countries/")
+        self.assertNotIn("Last-Modified", response)
+        last_modified = self.client.get("/api/countries/3/")["Last-Modified"]
+        self.assertEqual(self.client.delete("/api/countries/2/").status_code, 204)
+        response = self.client.get("/api/countries/", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.patch("/api/countries/3/", data={"name": "test88"}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get("/api/countries/3/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_countries_bulk(self):
+        call_command("natural_key_index", model=["country"], stdout=StringIO())
+        geometry = json.loads(Polygon(TEST_POLYGON).json)
+        data = {
+            "type": "FeatureCollection",
+            "features": [
+                {"type": "Feature", "properties": {"name": "bulk"}, "geometry": geometry},
+                {"type": "Feature", "properties": {"name": "turkey"}, "geometry": geometry},
+                {"type": "Feature", "properties": {"name": "invalid"}, "geometry": None},
+                {"type": "Feature", "properties": {"name": "bulk"}, "geometry": geometry},
+            ]
+        }
+        response = self.client.post("/api/countries/bulk/", data=data, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(result["created"], [Country.objects.get(name="bulk").pk])
+        self.assertEqual(result["updated"], [1])
+        self.assertEqual([error["index"] for error in result["errors"]], [2, 3])
+        self.assertEqual(Country.objects.get(pk=1).coordinates.coords, Polygon(TEST_POLYGON).coords)
+
+    def test_bulk_without_unique_index(self):
+        data = [{"name": "bulk", "coordinates": Polygon(TEST_POLYGON).wkt}]
+        response = self.client.post("/api/countries/bulk/", data=data, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("natural_key_index", response.json()["detail"])
+
+        Country.objects.create(name="serbia", coordinates=Polygon(TEST_POLYGON))
+        with self.assertRaisesMessage(CommandError, "duplicate name: serbia"):
+            call_command("natural_key_index", model=["country"], stdout=StringIO())
+
+    def test_cities_bulk_array(self):
+        call_command("natural_key_index", model=["city"], stdout=StringIO())
+        data = [
+            {"name": "bulk", "description": "", "country": 1, "coordinates": Polygon(TEST_POLYGON).wkt},
+            {"name": "bulk", "description": "", "country": 100, "coordinates": Polygon(TEST_POLYGON).wkt},
+        ]
+        response = self.client.post("/api/cities/bulk/", data=data, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(len(result["created"]), 1)
+        self.assertEqual(result["errors"][0]["index"], 1)
+        self.assertIn("country", result["errors"][0]["errors"])
+
+    def test_countries_export(self):
+        response = self.client.get("/api/countries/export/?format=ndjson")
+        self.assertEqual(response.status_code, 200)
+        features = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(len(features), Country.objects.count())
+        self.assertIn("area", features[0]["properties"])
+
+        response = self.client.get("/api/countries/export/?format=ndjson&bbox=10 10 50 50")
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()),
+                         self.client.get("/api/countries/?bbox=10 10 50 50").json()["count"])
+
+        response = self.client.get("/api/countries/export/?format=fgb")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"fgb"))
+
+    def test_countries_nearest(self):
+        # Точка в Анкаре: ближайшая страна - Турция с нулевым расстоянием
+        response = self.client.get("/api/countries/nearest/?lon=32.85&lat=39.93&k=2")
+        self.assertEqual(response.status_code, 200)
+        features = response.json()["features"]
+        self.assertEqual(len(features), 2)
+        self.assertEqual(features[0]["properties"]["name"], "turkey")
+        self.assertEqual(features[0]["properties"]["distance_m"], 0)
+        self.assertLess(features[0]["properties"]["distance_m"], features[1]["properties"]["distance_m"])
+
+        response = self.client.get("/api/countries/nearest/?lon=32.85&lat=39.93&max_distance=1000")
+        self.assertEqual([feature["id"] for feature in response.json()["features"]], [1])
+
+        for params in ("lon=32.85", "lon=200&lat=0", "lon=0&lat=0&k=0", "lon=0&lat=0&max_distance=a"):
+            self.assertEqual(self.client.get(f"/api/countries/nearest/?{params}").status_code, 400)
+
+    def test_countries_binary_formats(self):
+        response = self.client.get("/api/countries/?limit=2&area", HTTP_ACCEPT="application/vnd.geo-db.wkb")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/vnd.geo-db.wkb")
+        self.assertEqual(response["X-Total-Count"], str(Country.objects.count()))
+        self.assertIn('rel="next"', response["Link"])
+        records = list(decode_records(response.content))
+        self.assertEqual([pk for pk, _, _ in records], [1, 2])
+        country = Country.objects.get(pk=1)
+        pk, properties, geometry = records[0]
+        self.assertEqual(json.loads(properties), {"name": country.name, "area": country.area})
+        self.assertTrue(GEOSGeometry(memoryview(geometry)).equals_exact(country.coordinates, 1e-9))
+
+        response = self.client.get("/api/countries/1/?format=ewkb")
+        ((pk, _, geometry),) = decode_records(response.content)
+        self.assertEqual(GEOSGeometry(memoryview(geometry)).srid, 4326)
+
+        response = self.client.get("/api/countries/?format=twkb&precision=3")
+        self.assertEqual(len(list(decode_records(response.content))), min(Country.objects.count(), 10))
+
+        response = self.client.get("/api/countries/?limit=2", HTTP_ACCEPT="application/geo+json-seq")
+        features = [json.loads(feature) for feature in response.content.split(b"\x1e")[1:]]
+        self.assertEqual(features, self.client.get("/api/countries/?limit=2").json()["features"])
+
+        response = self.client.get("/api/countries/?limit=2&format=fgb")
+        self.assertEqual(response["Content-Type"], "application/flatgeobuf")
+        self.assertTrue(response.content.startswith(b"fgb"))
+        response = self.client.get("/api/countries/1/", HTTP_ACCEPT="application/flatgeobuf")
+        self.assertTrue(response.content.startswith(b"fgb"))
+
+        response = self.client.get("/api/countries/1/cities/", HTTP_ACCEPT="application/vnd.geo-db.wkb")
+        self.assertEqual(response["Content-Type"], "application/vnd.geo-db.wkb")
+        response = self.client.get("/api/countries/nearest/?lon=20&lat=44", HTTP_ACCEPT="application/vnd.geo-db.wkb")
+        self.assertEqual(response.status_code, 406)
+
+    def test_fast_json_renderer(self):
+        expected = json.loads(json.dumps(CountySerializer(Country.objects.get(pk=1)).data))
+        with override_settings(GEOJSON_FROM_DATABASE=False):
+            self.assertEqual(self.client.get("/api/countries/1/").json(), expected)
+            features = self.client.get("/api/countries/?limit=100").json()["features"]
+        self.assertEqual([feature for feature in features if feature["id"] == 1][0], expected)
+
+        output = StringIO()
+        call_command("benchmark_json", repeat=1, stdout=output)
+        self.assertIn("geometry fragments", output.getvalue())
+
+    def test_countries_sparse_fields(self):
+        country = Country.objects.get(pk=1)
+        for geojson_from_database in (False, True):
+            with override_settings(GEOJSON_FROM_DATABASE=geojson_from_database):
+                response = self.client.get("/api/countries/?limit=100&fields=area&geometry=none")
+                feature = [feature for feature in response.json()["features"] if feature["id"] == 1][0]
+                self.assertIsNone(feature["geometry"])
+                self.assertEqual(feature["properties"], {"area": country.area})
+
+                response = self.client.get("/api/countries/?limit=100&fields=name&geometry=centroid")
+                feature = [feature for feature in response.json()["features"] if feature["id"] == 1][0]
+                self.assertEqual(feature["properties"], {"name": country.name})
+                centroid = GEOSGeometry(json.dumps(feature["geometry"]))
+                self.assertEqual(centroid.geom_type, "Point")
+                self.assertTrue(country.coordinates.envelope.contains(centroid))
+
+        feature = self.client.get("/api/countries/1/?geometry=bbox").json()
+        self.assertEqual(GEOSGeometry(json.dumps(feature["geometry"])).extent, country.coordinates.extent)
+        self.assertEqual(self.client.get("/api/countries/?fields=wrong").status_code, 400)
+        self.assertEqual(self.client.get("/api/countries/?geometry=wrong").status_code, 400)
+
+    def test_countries_server_timing(self):
+        with override_settings(GEOJSON_FROM_DATABASE=False):
+            response = self.client.get("/api/countries/?limit=100&total_area")
+        timing = response["Server-Timing"]
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+        for stage in ("aggregate", "serialize", "geometry", "render", "total"):
+            self.assertIn(f"{stage};dur=", timing)
+
+        content = self.client.get("/metrics").content.decode()
+        self.assertIn('geo_db_request_duration_seconds_count{route="country-list"}', content)
+        self.assertIn('geo_db_response_bytes_bucket{route="country-list",le="+Inf"}', content)
+
+    def test_plain_json_renderer(self):
+        # JSON_RENDERER=rest_framework.renderers.JSONRenderer: геометрия без JSONFragment
+        with mock.patch.object(CountryViewSet, "renderer_classes", [JSONRenderer]), \
+                override_settings(GEOJSON_FROM_DATABASE=False):
+            response = self.client.get("/api/countries/1/")
+            self.assertEqual(response.status_code, 200)
+            self.assertIsInstance(response.json()["geometry"], dict)
+            response = self.client.get("/api/countries/?limit=2")
+            self.assertEqual(response.status_code, 200)
+
+    def test_import_geo(self):
+        collection = {
+            "type": "FeatureCollection",
+            "features": [
+                {"type": "Feature", "properties": {"NAME_EN": "imported"},
+                 "geometry": json.loads(Polygon(TEST_POLYGON).json)},
+                {"type": "Feature", "properties": {"NAME_EN": "out of range"},
+                 "geometry": {"type": "Polygon", "coordinates": [[[0, 0], [200, 0], [0, 10], [0, 0]]]}},
+            ]
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "countries.geojson")
+            with open(path, "w") as file:
+                json.dump(collection, file)
+            call_command("import_geo", path, model="country", pairs=["name=NAME_EN"], stdout=StringIO(),
+                         stderr=StringIO())
+
+        country = Country.objects.get(name="imported")
+        self.assertIsNotNone(country.area)
+        self.assertFalse(Country.objects.filter(name="out of range").exists())
+
+    def test_import_geo_duplicates(self):
+        geometry = json.loads(Polygon(TEST_POLYGON).json)
+        collection = {
+            "type": "FeatureCollection",
+            "features": [{"type": "Feature", "properties": {"NAME_EN": name}, "geometry": geometry}
+                         for name in ("imported", "imported", "serbia", "imported")]
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "countries.geojson")
+            with open(path, "w") as file:
+                json.dump(collection, file)
+            stderr = StringIO()
+            call_command("import_geo", path, model="country", pairs=["name=NAME_EN"], batch_size=2, upsert=True,
+                         stdout=StringIO(), stderr=stderr)
+
+        self.assertIn("duplicate name", stderr.getvalue())
+        self.assertEqual(Country.objects.filter(name="imported").count(), 1)
+        serbia = Country.objects.get(name="serbia")
+        self.assertTrue(serbia.coordinates.equals_exact(Polygon(TEST_POLYGON), 1e-9))
+
+    def test_countries_server_side_cursor(self):
+        url = "/api/countries/?limit=3&area"
+        expected = self.client.get(url).json()
+        for geojson_from_database in (True, False):
+            get_cache().clear()
+            with override_settings(GEOJSON_FROM_DATABASE=geojson_from_database):
+                response = self.client.get(url + "&stream=1")
+                self.assertEqual(json.loads(b"".join(response.streaming_content)), expected)
+
+    def test_countries_cursor_pagination(self):
+        response = self.client.get("/api/countries/?cursor=&limit=2")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([feature["id"] for feature in data["features"]], [1, 2])
+        self.assertIsNone(data["previous_link"])
+
+        response = self.client.get(data["next_link"])
+        data = response.json()
+        self.assertEqual([feature["id"] for feature in data["features"]], [3])
+        self.assertIsNone(data["next_link"])
+
+        response = self.client.get(data["previous_link"])
+        data = response.json()
+        self.assertEqual([feature["id"] for feature in data["features"]], [1, 2])
+
+    def test_countries_wrong_cursor(self):
+        response = self.client.get("/api/countries/?cursor=wrong")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get("/api/countries/?cursor=&ordering=-area")
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_countries_stream(self):
+        url = "/api/countries/?stream=1&total_area&limit=2"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        data = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(data["type"], "FeatureCollection")
+        self.assertEqual(len(data["features"]), 2)
+        self.assertEqual(data["count"], 3)
+        self.assertIn("total_area", data)
+        self.assertIsNotNone(data["next_link"])
+
+    @override_settings(METRICS_ENABLED=True)
+    def test_get_countries_stream_metrics(self):
+        response = self.client.get("/api/countries/?stream=1&limit=2")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Server-Timing", response)
+        data = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(len(data["features"]), 2)
 
-class EndpointCity(TestCase):
+        content = self.client.get("/metrics").content.decode()
+        self.assertIn('geo_db_response_bytes_count{route="country-list"}', content)
+
+
+class EndpointCity(GeoTestCase):
     fixtures = ["test_country", "test_city"]
 
     def sup_city_bbox(self, city: tuple[str], bbox: str):
@@ -131,14 +545,39 @@ class EndpointCity(TestCase):
         for city in city:
             self.assertContains(response, city)
 
+    def test_database_geojson_same_format(self):
+        expected = CitySerializer(City.objects.get(pk=2)).data
+
+        with override_settings(GEOJSON_FROM_DATABASE=True):
+            response = self.client.get("/api/cities/?limit=100")
+        self.assertEqual(response.status_code, 200)
+        feature = [feature for feature in response.json()["features"] if feature["id"] == 2][0]
+
+        self.assertEqual(list(feature.keys()), list(expected.keys()))
+        self.assertEqual(feature["properties"], expected["properties"])
+        self.assertEqual(feature["geometry"]["type"], expected["geometry"]["type"])
+        self.assertEqual(len(feature["geometry"]["coordinates"][0]), len(expected["geometry"]["coordinates"][0]))
+
+    def test_country_cities_fields(self):
+        response = self.client.get("/api/countries/3/cities/?fields=description&geometry=none")
+        self.assertEqual(response.status_code, 200)
+        for feature in response.json()["features"]:
+            self.assertEqual(feature["properties"], {"description": "test desc"})
+        self.assertEqual(self.client.get("/api/countries/3/cities/?fields=wrong").status_code, 400)
+
     def test_city_bbox(self):
         self.sup_city_bbox(("opornica", "resnik"), "20.828530482799607 44.04283412827576 20.954330958696545 44.12627250468475")
         self.sup_city_bbox(("resnik",), "20.890127310203695 44.103420443101044 20.951539625376938 44.13638003111589")
 
 
-class EndpointCapital(TestCase):
+class EndpointCapital(GeoTestCase):
     fixtures = ["test_country", "test_capital"]
 
+    def test_country_capital_fields(self):
+        response = self.client.get("/api/countries/1/capital/?fields=country")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["properties"], {"country": 1})
+
     def test_create_capital(self):
         url = "/api/capitals/"
         data = {
@@ -186,7 +625,7 @@ class EndpointCapital(TestCase):
 
 
 
-class EndpointImage(TestCase):
+class EndpointImage(GeoTestCase):
     fixtures = ["test_country", "test_city"]
 
     def test_endpoint_images(self):
@@ -211,5 +650,121 @@ class EndpointImage(TestCase):
         # with open("test.png", 'wb') as file:
         #     file.write(binary_data)
 
+        response = self.client.get(url + "1/raw/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/png")
+        # Middleware метрик не подменяет файл, ответ уходит через wsgi.file_wrapper
+        self.assertIsNotNone(response.file_to_stream)
+        self.assertEqual(b"".join(response.streaming_content), binary_data)
+        etag = response["ETag"]
+
+        response = self.client.get(url + "1/raw/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertIn("Last-Modified", response)
+
+        response = self.client.get("/api/cities/2/photos/?limit=5")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["count"], 1)
+        self.assertEqual(data["photos"][0]["number"], 1)
+        self.assertNotIn("base64_image", data["photos"][0])
+
+        response = self.client.get(url + "2/")
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(url + "1/raw/?size=thumb")
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(url + "1/?size=huge")
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(url + "1/raw/", HTTP_RANGE="bytes=0-9")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), binary_data[:10])
+
         response = self.client.delete(url + "1/")
         self.assertContains(response, "delete image", status_code=200)
+
+
+    def test_render_derivatives(self):
+        with tempfile.TemporaryDirectory() as target_dir:
+            names = render_derivatives(r"media/test/test_image.png", target_dir, "test")
+            self.assertEqual(set(names.keys()), {"thumb", "medium", "webp"})
+
+            with Image.open(os.path.join(target_dir, "test_thumb.png")) as image:
+                self.assertLessEqual(max(image.size), 160)
+            with Image.open(os.path.join(target_dir, "test_webp.webp")) as image:
+                self.assertEqual(image.format, "WEBP")
+
+
+class EndpointAsync(GeoTestCase):
+    fixtures = ["test_country", "test_city", "test_capital"]
+
+    def test_same_response(self):
+        for url in ("countries/?area&limit=2&offset=1", "countries/1/?precision=3", "countries/3/cities/?zoom=3",
+                    "cities/?total_area=all", "capitals/2/"):
+            response = self.client.get(f"/api/async/{url}")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), self.client.get(f"/api/{url}").json())
+
+    def test_errors(self):
+        self.assertEqual(self.client.get("/api/async/countries/100/").status_code, 404)
+        self.assertEqual(self.client.get("/api/async/countries/100/capital/").status_code, 404)
+        self.assertEqual(self.client.get("/api/async/countries/?zoom=100").status_code, 400)
+        self.assertEqual(self.client.get("/api/async/cities/4/images/1/").status_code, 400)
+
+    def test_bbox_debug_plan(self):
+        # LOG_LEVEL=DEBUG: план запроса bbox не запрашивается синхронно из async view
+        bbox = "14.533444941126703 32.43752552067821 46.39631982796453 48.66047888075295"
+        with mock.patch.object(filters.logger, "isEnabledFor", return_value=True):
+            response = self.client.get(f"/api/async/countries/?bbox={bbox}")
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "serbia")
+
+
+@override_settings(LOCATE_INDEX_CHECK_INTERVAL=0)
+class EndpointLocate(GeoTestCase):
+    fixtures = ["test_country", "test_city", "test_capital"]
+
+    def test_locate(self):
+        city = City.objects.get(pk=4)
+        point = city.coordinates.point_on_surface
+        for locate_index in (True, False):
+            with override_settings(LOCATE_INDEX=locate_index):
+                response = self.client.get(f"/api/locate?lon={point.x}&lat={point.y}")
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()["city"], 4)
+                self.assertEqual(response.json()["country"], city.country_id)
+
+                response = self.client.post("/api/locate", data={"points": [[point.x, point.y], [0, -89]]},
+                                            content_type="application/json")
+                self.assertEqual(response.json()["results"][0]["city"], 4)
+                self.assertEqual(response.json()["results"][1], {"country": None, "city": None, "capital": None})
+
+    def test_locate_wrong(self):
+        self.assertEqual(self.client.get("/api/locate?lon=1").status_code, 400)
+        for data in ([], [[1, 2, 3]], [["a", 1]], [[200, 0]]):
+            response = self.client.post("/api/locate", data=data, content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+
+
+class EndpointTile(GeoTestCase):
+    fixtures = ["test_country", "test_city"]
+
+    def test_tile(self):
+        response = self.client.get("/api/tiles/countries/0/0/0.mvt")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/vnd.mapbox-vector-tile")
+        self.assertGreater(len(response.content), 0)
+
+    def test_tile_bbox(self):
+        response = self.client.get("/api/tiles/cities/0/0/0.mvt?bbox=0 0 1 1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.content), 0)
+
+    def test_tile_wrong(self):
+        response = self.client.get("/api/tiles/countries/1/5/0.mvt")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get("/api/tiles/rivers/0/0/0.mvt")
+        self.assertEqual(response.status_code, 404)
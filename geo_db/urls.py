@@ -1,5 +1,6 @@
-from django.urls import path, include
+from django.urls import path, include, re_path
 from rest_framework import routers
+from geo_db import async_views
 from geo_db.views import *
 
 router = routers.SimpleRouter()
@@ -8,5 +9,13 @@ router.register(r"cities", CityViewSet)
 router.register(r"capitals", CapitalViewSet)
 
 urlpatterns = [
+    re_path(r"^locate/?$", locate_points, name="locate"),
+    path("tiles/<str:layer>/<int:z>/<int:x>/<int:y>.mvt", tile, name="tile"),
+    path("async/countries/<int:pk>/cities/", async_views.country_cities, name="async-country-cities"),
+    path("async/countries/<int:pk>/capital/", async_views.country_capital, name="async-country-capital"),
+    path("async/cities/<int:pk>/images/", async_views.city_images, name="async-city-images"),
+    path("async/cities/<int:pk>/images/<int:num_image>/", async_views.city_images, name="async-city-images"),
+    path("async/<str:resource>/", async_views.feature_list, name="async-list"),
+    path("async/<str:resource>/<int:pk>/", async_views.feature_retrieve, name="async-detail"),
     path("", include(router.urls)),
 ]
@@ -1,32 +1,185 @@
 import os
 
 import django_filters
-from django.contrib.gis.db.models.functions import Area
-from django.http import Http404
+from django.conf import settings
+from django.contrib.gis.db.models.functions import Distance, GeometryDistance
+from django.contrib.gis.measure import D
+from django.db import transaction
+from django.db.models import Q
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.functional import cached_property
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_GET
 from rest_framework import status, viewsets
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import ValidationError
 from rest_framework.request import Request
 from rest_framework.response import Response
 
+from geo_db.additional_modules.bulk import (check_coordinates, check_objects, get_bulk_items, get_item_data,
+                                            has_unique_index, upsert)
+from geo_db.additional_modules.cache import get_cached_response, get_response_cache_key, set_cached_response
+from geo_db.additional_modules.conditional import get_validators
+from geo_db.additional_modules.derivatives import DERIVATIVES
+from geo_db.additional_modules.export import EXPORT_FORMATS, iter_export
+from geo_db.additional_modules.files import file_response
+from geo_db.additional_modules.geometry import GeometryOptions, parse_point
+from geo_db.additional_modules.locate import locate, parse_points
+from geo_db.additional_modules.metrics import render_metrics, timer
 from geo_db.additional_modules.pagination import pagination, Paginator, get_paginator
+from geo_db.additional_modules.tiles import get_tile, validate_tile
 from geo_db.filters import CountryFilter, CityFilter, CapitalFilter
 from geo_db.models import Country, City, Photo, Capital
-from geo_db.serializers import CountySerializer, DataCollectionSerializer, CitySerializer, CapitalSerializer
+from geo_db.renderers import EXPORT_RENDERERS, GEOMETRY_RENDERERS, GeometryRenderer
+from geo_db.serializers import CountySerializer, DataCollectionSerializer, CitySerializer, CapitalSerializer, \
+    PhotoSerializer
+
+
+# Во сколько раз больше k берётся кандидатов по индексу для nearest
+NEAREST_CANDIDATES = 4
 
 
 class BaseViewSet(viewsets.ModelViewSet):
+    # action -> модели, от которых зависит ответ, для кэша ответов
+    cache_models = {}
+    # Поля, по которым bulk находит существующие объекты; уникальный индекс на них создаёт natural_key_index
+    bulk_natural_key = ("name",)
+    # Действия, которые кроме JSON отдают бинарные форматы геометрии (по Accept или ?format=),
+    # остальные на такой Accept отвечают 406
+    geometry_actions = ("list", "retrieve", "cities", "capital")
+
+    def dispatch(self, request, *args, **kwargs):
+        models = self.cache_models.get(self.action_map.get(request.method.lower()))
+        if request.method != "GET" or models is None or not settings.RESPONSE_CACHE_ENABLED:
+            return super().dispatch(request, *args, **kwargs)
+
+        with timer("cache"):
+            key = get_response_cache_key(request, models)
+            response = get_cached_response(key)
+        if response is not None:
+            last_modified = parse_http_date_safe(response.get("Last-Modified", ""))
+            return get_conditional_response(request, etag=response.get("ETag"), last_modified=last_modified,
+                                            response=response)
+
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK and not response.streaming:
+            set_cached_response(key, response)
+        return response
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if self.action in self.geometry_actions:
+            renderers += [renderer() for renderer in GEOMETRY_RENDERERS]
+        return renderers
+
+    def check_not_modified(self, queryset, collection: bool = False):
+        with timer("conditional"):
+            etag, last_modified = get_validators(queryset, self.request)
+        if collection:
+            # max(updated_at) не меняется при удалении строк, для списков только ETag (учитывает количество)
+            last_modified = None
+        self.conditional_headers = {"ETag": etag}
+        if last_modified is not None:
+            self.conditional_headers["Last-Modified"] = http_date(last_modified)
+        return get_conditional_response(self.request, etag=etag, last_modified=last_modified)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        conditional_headers = getattr(self, "conditional_headers", None)
+        if conditional_headers is not None and response.status_code in (200, 304):
+            for header, value in conditional_headers.items():
+                response[header] = value
+        return response
+
+    # Массовое создание/обновление по натуральному ключу, ошибки возвращаются для каждого элемента
+    @action(detail=False, methods=['POST'])
+    def bulk(self, request: Request):
+        items = get_bulk_items(request.data)
+        model = self.queryset.model
+        if not has_unique_index(model, self.bulk_natural_key):
+            raise ValidationError({"detail": f"bulk requires a unique index on {', '.join(self.bulk_natural_key)}, "
+                                             f"create it with manage.py natural_key_index"})
+        context = self.get_serializer_context()
+        context["upsert"] = True
+        serializer = self.serializer_class(context=context)
+
+        validated, errors = {}, []
+        for index, item in enumerate(items):
+            try:
+                validated[index] = serializer.run_validation(get_item_data(item))
+            except ValidationError as e:
+                errors.append({"index": index, "errors": e.detail})
+        errors += check_coordinates(validated)
+        objs = {index: model(**data) for index, data in validated.items()}
+
+        update_fields = [field for field in self.serializer_class.Meta.fields
+                         if field not in ("id", "area") and field not in self.bulk_natural_key]
+        with transaction.atomic():
+            errors += check_objects(model, objs, self.bulk_natural_key)
+            created, updated = upsert(model, list(objs.values()), self.bulk_natural_key, update_fields)
+
+        errors.sort(key=lambda error: error["index"])
+        return Response({"created": created, "updated": updated, "errors": errors})
+
+    # k ближайших к точке объектов: кандидаты по индексу (<->), точное расстояние только для них
+    @action(detail=False, methods=['GET'])
+    def nearest(self, request: Request):
+        point = parse_point(request.query_params)
+        try:
+            k = int(request.query_params.get("k", 10))
+            max_distance = request.query_params.get("max_distance")
+            max_distance = float(max_distance) if max_distance is not None else None
+        except ValueError:
+            raise ValidationError({"detail": "k and max_distance must be numbers"})
+        if not (0 < k <= settings.NEAREST_MAX_K):
+            raise ValidationError({"detail": f"k in (1, ..., {settings.NEAREST_MAX_K})"})
+        if max_distance is not None and max_distance < 0:
+            raise ValidationError({"detail": "max_distance must be positive"})
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if max_distance is not None:
+            queryset = queryset.filter(coordinates__dwithin=(point, D(m=max_distance)))
+
+        # Порядок индекса близок к точному расстоянию по сфероиду, поэтому кандидатов берётся с запасом
+        candidates = queryset.order_by(GeometryDistance("coordinates", point)).values("pk")[:k * NEAREST_CANDIDATES]
+        instances = queryset.filter(pk__in=candidates).annotate(
+            distance=Distance("coordinates", point)).order_by("distance", "pk")[:k]
+
+        feature_serializer = self.serializer_class(context=self.get_serializer_context())
+        features = []
+        for obj in instances:
+            feature = feature_serializer.to_representation(obj)
+            feature["properties"]["distance_m"] = obj.distance.m
+            features.append(feature)
+        return Response({"type": "FeatureCollection", "features": features})
+
+    # Полная выгрузка с учётом фильтров (bbox), формат выбирается через ?format= или Accept
+    @action(detail=False, methods=['GET'], renderer_classes=EXPORT_RENDERERS)
+    def export(self, request: Request):
+        queryset = self.filter_queryset(self.queryset.all())
+        export_format = request.accepted_renderer.format
+        layer_name = queryset.model._meta.model_name
+        content = iter_export(queryset, self.serializer_class, export_format, layer_name)
+
+        response = StreamingHttpResponse(content, content_type=request.accepted_renderer.media_type)
+        response["Content-Disposition"] = f'attachment; filename="{layer_name}.{EXPORT_FORMATS[export_format][1]}"'
+        return response
+
+    @cached_property
+    def geometry_options(self):
+        return GeometryOptions(self.request.query_params)
 
     def get_queryset(self):
-        queryset = self.queryset
-        if "area" in self.request.query_params or "total_area" in self.request.query_params:
-            queryset = queryset.annotate(area=Area('coordinates'))
-        return queryset
+        return self.serializer_class.project_queryset(super().get_queryset(), self.geometry_options)
 
-    # def get_serializer_context(self):
-    #     context = {}
-    #     if "area" in self.request.query_params:
-    #         context["area"] = True
-    #     return context
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["geometry"] = self.geometry_options
+        # Фрагменты геометрии без разбора только для рендерера, который умеет их вставлять
+        renderer = getattr(self.request, "accepted_renderer", None)
+        context["json_fragments"] = getattr(renderer, "supports_fragments", False)
+        return context
 
     def get_target_obj(self, pk):
         queryset = self.get_queryset().filter(pk=pk)
@@ -34,20 +187,77 @@ class BaseViewSet(viewsets.ModelViewSet):
             raise Http404(f"{self.name_model} not found")
         return queryset[0]
 
+    def get_parent_obj(self, pk):
+        # Для вложенных маршрутов (cities, capital, images): ?fields= и ?geometry= относятся к вложенному ресурсу
+        obj = self.queryset.model.objects.only("pk").filter(pk=pk).first()
+        if obj is None:
+            raise Http404(f"{self.name_model} not found")
+        return obj
+
     def retrieve(self, request, *args, pk, **kwargs):
+        not_modified = self.check_not_modified(self.get_queryset().filter(pk=pk))
+        if not_modified is not None:
+            return not_modified
+
         queryset = self.get_target_obj(pk)
+        if isinstance(request.accepted_renderer, GeometryRenderer):
+            return self.get_encoded_response(self.get_queryset().filter(pk=pk), self.serializer_class)
         feature = self.serializer_class(queryset, context=self.get_serializer_context()).data
         return Response(feature)
 
-    @pagination
-    def list(self, request, *args, paginator: Paginator, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
-        feature_collection = DataCollectionSerializer.get_feature_collection(queryset, self.serializer_class,
+    def is_stream(self, paginator: Paginator):
+        stream = self.request.query_params.get("stream")
+        if stream is None:
+            return paginator.limit > settings.STREAM_LIMIT_THRESHOLD
+        return stream.lower() not in ("0", "false")
+
+    def get_encoded_response(self, queryset, serializer, paginator: Paginator = None):
+        renderer = self.request.accepted_renderer
+        with timer("serialize"):
+            if paginator is None:
+                content, _ = DataCollectionSerializer.encode_page(queryset, serializer, self.get_serializer_context(),
+                                                                  None, self.request.query_params, renderer.format)
+                headers = {}
+            else:
+                content, headers = DataCollectionSerializer.get_encoded_collection(queryset, serializer,
+                                                                                   self.get_serializer_context(),
+                                                                                   paginator,
+                                                                                   self.request.query_params,
+                                                                                   renderer.format)
+        response = HttpResponse(content, content_type=renderer.media_type)
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    def get_feature_collection_response(self, queryset, serializer, paginator: Paginator):
+        if isinstance(self.request.accepted_renderer, GeometryRenderer):
+            return self.get_encoded_response(queryset, serializer, paginator)
+
+        query_params = self.request.query_params
+        stream = self.is_stream(paginator)
+        if stream or settings.GEOJSON_FROM_DATABASE:
+            content = DataCollectionSerializer.stream_feature_collection(queryset, serializer,
+                                                                         self.get_serializer_context(),
+                                                                         paginator,
+                                                                         query_params)
+            if stream:
+                return StreamingHttpResponse(content, content_type="application/json")
+            return HttpResponse(b"".join(content), content_type="application/json")
+
+        feature_collection = DataCollectionSerializer.get_feature_collection(queryset, serializer,
                                                                              self.get_serializer_context(),
                                                                              paginator,
-                                                                             request.query_params)
+                                                                             query_params)
         return Response(feature_collection)
 
+    @pagination
+    def list(self, request, *args, paginator: Paginator, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        not_modified = self.check_not_modified(queryset, collection=True)
+        if not_modified is not None:
+            return not_modified
+        return self.get_feature_collection_response(queryset, self.serializer_class, paginator)
+
 
 class CountryViewSet(BaseViewSet):
     queryset = Country.objects.all()
@@ -55,33 +265,45 @@ class CountryViewSet(BaseViewSet):
     filter_backends = [django_filters.rest_framework.DjangoFilterBackend]
     filterset_class = CountryFilter
     name_model = "Country"
+    cache_models = {
+        "list": (Country,),
+        "retrieve": (Country,),
+        "nearest": (Country,),
+        "cities": (Country, City),
+        "capital": (Country, Capital),
+    }
 
     # Отдаёт список городов страны
     @action(detail=True, methods=['GET'])
     def cities(self, request: Request, pk: int):
         paginator = get_paginator(request)
-        self.get_target_obj(pk)
-        queryset = City.objects.all().filter(country_id=pk)
+        self.get_parent_obj(pk)
+        queryset = CitySerializer.project_queryset(City.objects.all().filter(country_id=pk), self.geometry_options)
         queryset = CityFilter(data=request.query_params, queryset=queryset).qs
-        feature_collection = DataCollectionSerializer.get_feature_collection(queryset, CitySerializer,
-                                                                             self.get_serializer_context(),
-                                                                             paginator,
-                                                                             request.query_params)
-        return Response(feature_collection)
+        not_modified = self.check_not_modified(queryset, collection=True)
+        if not_modified is not None:
+            return not_modified
+        return self.get_feature_collection_response(queryset, CitySerializer, paginator)
 
     @action(detail=True, methods=['GET'])
     def capital(self, request: Request, pk: int):
-        self.get_target_obj(pk)
-        queryset = Capital.objects.filter(country_id=pk)
+        self.get_parent_obj(pk)
+        queryset = CapitalSerializer.project_queryset(Capital.objects.filter(country_id=pk), self.geometry_options)
+        not_modified = self.check_not_modified(queryset)
+        if not_modified is not None:
+            return not_modified
+
         if len(queryset) != 1:
             raise Http404(f"capital not found")
+        if isinstance(request.accepted_renderer, GeometryRenderer):
+            return self.get_encoded_response(queryset, CapitalSerializer)
         data = queryset[0]
-        feature = self.serializer_class(data, context=self.get_serializer_context()).data
+        feature = CapitalSerializer(data, context=self.get_serializer_context()).data
         return Response(feature)
 
     @capital.mapping.post
     def post_capital(self, request: Request, pk: int):
-        self.get_target_obj(pk)
+        self.get_parent_obj(pk)
 
         obj = CapitalSerializer(data=request.data)
         obj.is_valid(raise_exception=True)
@@ -95,7 +317,7 @@ class CountryViewSet(BaseViewSet):
 
     @capital.mapping.delete
     def delete_capital(self, request: Request, pk: int):
-        self.get_target_obj(pk)
+        self.get_parent_obj(pk)
         queryset = Capital.objects.filter(country_id=pk)
         if len(queryset) != 1:
             raise Http404(f"capital not found")
@@ -106,7 +328,7 @@ class CountryViewSet(BaseViewSet):
 
     @capital.mapping.put
     def put_capital(self, request: Request, pk: int):
-        self.get_target_obj(pk)
+        self.get_parent_obj(pk)
         queryset = Capital.objects.filter(country_id=pk)
         if len(queryset) != 1:
             raise Http404(f"capital not found")
@@ -123,7 +345,7 @@ class CountryViewSet(BaseViewSet):
 
     @capital.mapping.patch
     def patch_capital(self, request: Request, pk: int):
-        self.get_target_obj(pk)
+        self.get_parent_obj(pk)
         queryset = Capital.objects.filter(country_id=pk)
         if len(queryset) != 1:
             raise Http404(f"capital not found")
@@ -147,10 +369,22 @@ class CityViewSet(BaseViewSet):
     filter_backends = [django_filters.rest_framework.DjangoFilterBackend]
     filterset_class = CityFilter
     name_model = "City"
+    bulk_natural_key = ("name", "country")
+    cache_models = {
+        "list": (City,),
+        "retrieve": (City,),
+        "nearest": (City,),
+        "photos": (City, Photo),
+    }
+
+    @staticmethod
+    def get_city_photos(city_id):
+        # Порядок совпадает с индексом (city_id, time_created)
+        return Photo.objects.filter(city_id=city_id).order_by("time_created", "id")
 
     def get_images(self, city_id, num_image):
-        photos = Photo.objects.filter(city_id=city_id).order_by("time_created")
-        total_images = len(photos)
+        photos = self.get_city_photos(city_id)
+        total_images = photos.count()
 
         if num_image is None:
             return Response(data={"total_images": total_images}, status=status.HTTP_200_OK)
@@ -158,11 +392,19 @@ class CityViewSet(BaseViewSet):
         if not (0 < num_image <= total_images):
             return Response({"detail": f"num_image in (1, ..., {total_images})"}, status=status.HTTP_400_BAD_REQUEST)
 
-        return photos
+        # OFFSET num_image - 1 LIMIT 1, загружается только нужная строка
+        return total_images, photos[num_image - 1]
+
+    def get_image_size(self):
+        size = self.request.query_params.get("size")
+        if size is not None and size not in DERIVATIVES:
+            raise ValidationError({"detail": f"size in {tuple(DERIVATIVES.keys())}"})
+        return size
 
     @action(detail=True, methods=['GET'], url_path='images(?:/(?P<num_image>\d+))?')
     def images(self, request: Request, pk: int, num_image: int = None):
-        self.get_target_obj(pk)
+        self.get_parent_obj(pk)
+        size = self.get_image_size()
         if num_image is not None:
             num_image = int(num_image)
 
@@ -170,13 +412,50 @@ class CityViewSet(BaseViewSet):
         if isinstance(result, Response):
             return result
 
+        total_images, photo = result
         return Response(data={
-            "total_images": len(result),
+            "total_images": total_images,
             "number_image": num_image,
-            "base64_image": result[num_image - 1].get_image_base64()
+            "base64_image": photo.get_image_base64(size)
         },
             status=status.HTTP_200_OK)
 
+    @action(detail=True, methods=['GET'], url_path='images/(?P<num_image>\d+)/raw')
+    def image_raw(self, request: Request, pk: int, num_image: int):
+        self.get_parent_obj(pk)
+        size = self.get_image_size()
+        num_image = int(num_image)
+
+        result = self.get_images(pk, num_image)
+        if isinstance(result, Response):
+            return result
+
+        total_images, photo = result
+        return file_response(request, photo.get_image(size), photo.time_created)
+
+    # Список фото города с пагинацией, только метаданные без самих изображений
+    @action(detail=True, methods=['GET'])
+    def photos(self, request: Request, pk: int):
+        self.get_parent_obj(pk)
+        paginator = get_paginator(request)
+
+        photos = self.get_city_photos(pk)
+        count_data = photos.count()
+        page = list(paginator.paginate_queryset(photos.defer("city")))
+        if len(page) != 0:
+            paginator.set_page_bounds(page[0].pk, page[-1].pk, len(page))
+            first = page[0]
+            number = photos.filter(Q(time_created__lt=first.time_created) |
+                                   Q(time_created=first.time_created, id__lt=first.id)).count() + 1
+
+        data = PhotoSerializer(page, many=True).data
+        for i, photo in enumerate(data):
+            photo["number"] = number + i
+
+        result = {"photos": data}
+        result.update(paginator.get_pagination_data(count_data))
+        return Response(result)
+
     @images.mapping.delete
     def image_delete(self, request, pk: int, num_image: int = None):
         if num_image is None:
@@ -187,13 +466,14 @@ class CityViewSet(BaseViewSet):
 
         if isinstance(result, Response):
             return result
-        result[num_image - 1].delete()
+        total_images, photo = result
+        photo.delete()
         return Response({"detail": f"delete image city {pk} number image {num_image}"})
 
     @images.mapping.post
     def image_post(self, request: Request, pk, *args, **kwargs):
         os.makedirs(os.path.dirname(r"media/"), exist_ok=True)
-        city = self.get_target_obj(pk)
+        city = self.get_parent_obj(pk)
 
         base64_image = request.data.get("base64_image")
         if base64_image is None:
@@ -210,7 +490,63 @@ class CapitalViewSet(BaseViewSet):
     filter_backends = [django_filters.rest_framework.DjangoFilterBackend]
     filterset_class = CapitalFilter
     name_model = "Capital"
-
-
-
-
+    bulk_natural_key = ("country",)
+    cache_models = {
+        "list": (Capital,),
+        "retrieve": (Capital,),
+        "nearest": (Capital,),
+    }
+
+
+TILE_LAYERS = {
+    "countries": (Country, CountryFilter),
+    "cities": (City, CityFilter),
+    "capitals": (Capital, CapitalFilter),
+}
+
+
+@require_GET
+def tile(request, layer: str, z: int, x: int, y: int):
+    if layer not in TILE_LAYERS:
+        raise Http404(f"layer {layer} not found")
+
+    try:
+        validate_tile(z, x, y)
+    except ValueError as e:
+        return JsonResponse({"detail": e.args[0]}, status=400)
+
+    model, filter_class = TILE_LAYERS[layer]
+    try:
+        queryset = filter_class(data=request.GET, queryset=model.objects.all()).qs
+        content = get_tile(queryset, layer, z, x, y)
+    except ValidationError as e:
+        return JsonResponse(e.detail, status=400)
+
+    response = HttpResponse(content, content_type="application/vnd.mapbox-vector-tile")
+    patch_cache_control(response, public=True, max_age=settings.TILE_CACHE_MAX_AGE)
+    return response
+
+
+LOCATE_MODELS = {
+    "country": Country,
+    "city": City,
+    "capital": Capital,
+}
+
+
+# id страны, города и столицы, в которые попадает точка (GET) или каждая точка из списка (POST)
+@api_view(["GET", "POST"])
+def locate_points(request: Request):
+    if request.method == "GET":
+        point = parse_point(request.query_params)
+        result = locate(LOCATE_MODELS, parse_points([[point.x, point.y]]))[0]
+        return Response({"lon": point.x, "lat": point.y, **result})
+
+    points = parse_points(request.data)
+    return Response({"results": locate(LOCATE_MODELS, points)})
+
+
+# Гистограммы по маршрутам в текстовом формате Prometheus, по памяти текущего процесса
+@require_GET
+def prometheus_metrics(request):
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -52,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'geo_db.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -93,9 +94,20 @@ DATABASES = {
         'PASSWORD': os.getenv("PASSWORD_DB"),
         'HOST': os.getenv("HOST_DB"),
         'PORT': os.getenv("PORT_DB"),
+        # Named cursors do not work behind pgbouncer in transaction pooling mode
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv("DB_DISABLE_SERVER_SIDE_CURSORS", "0") == "1",
     }
 }
 
+# Connection reuse
+# Persistent connections are on by default and health-checked before reuse, so a request does not
+# pay for a new PostgreSQL connection. Under ASGI (server/asgi.py) connections are per thread:
+# put pgbouncer in transaction pooling mode in front of the database, set DB_CONN_MAX_AGE=0 and
+# DB_DISABLE_SERVER_SIDE_CURSORS=1 so connection reuse is left to the pooler
+
+DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv("DB_CONN_MAX_AGE", 60))
+DATABASES['default']['CONN_HEALTH_CHECKS'] = os.getenv("DB_CONN_HEALTH_CHECKS", "1") == "1"
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -136,3 +148,112 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Streaming FeatureCollection
+# Pages larger than the threshold are sent through StreamingHttpResponse
+
+STREAM_LIMIT_THRESHOLD = int(os.getenv("STREAM_LIMIT_THRESHOLD", 1000))
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", 100))
+
+# Features of list endpoints are built in PostGIS (ST_AsGeoJSON/json_build_object)
+
+GEOJSON_FROM_DATABASE = os.getenv("GEOJSON_FROM_DATABASE", "1") == "1"
+
+# Mapbox Vector Tiles
+
+TILE_CACHE_MAX_AGE = int(os.getenv("TILE_CACHE_MAX_AGE", 3600))
+
+# Logging
+# LOG_LEVEL=DEBUG prints query plans of bbox filters
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {
+            "class": "logging.StreamHandler",
+        },
+    },
+    "loggers": {
+        "geo_db": {
+            "handlers": ["console"],
+            "level": os.getenv("LOG_LEVEL", "INFO"),
+        },
+    },
+}
+
+# Per-request metrics: Server-Timing header, histograms per route at /metrics,
+# METRICS_LOG=1 writes one JSON line per request to the geo_db.metrics logger
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_LOG = os.getenv("METRICS_LOG", "0") == "1"
+
+# Photo derivatives (thumbnail, medium, WebP) are rendered in a process pool
+
+PHOTO_DERIVATIVE_WORKERS = int(os.getenv("PHOTO_DERIVATIVE_WORKERS", 2))
+
+# Response cache
+# Any Django cache backend: locmem (LRU by MAX_ENTRIES), file or redis (LRU by maxmemory-policy of the server).
+# Model version counters live in this cache, so writes invalidate responses of other workers only
+# with a shared backend: the cache is enabled by default only for Redis/Memcached
+
+RESPONSE_CACHE_ALIAS = "responses"
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache")
+SHARED_CACHE_BACKENDS = ("RedisCache", "PyMemcacheCache", "PyLibMCCache")
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED",
+                                   "1" if RESPONSE_CACHE_BACKEND.endswith(SHARED_CACHE_BACKENDS) else "0") == "1"
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    RESPONSE_CACHE_ALIAS: {
+        "BACKEND": RESPONSE_CACHE_BACKEND,
+        "LOCATION": os.getenv("RESPONSE_CACHE_LOCATION", "geo_db_responses"),
+        "TIMEOUT": int(os.getenv("RESPONSE_CACHE_TIMEOUT", 600)),
+    },
+}
+if not RESPONSE_CACHE_BACKEND.endswith("RedisCache"):
+    CACHES[RESPONSE_CACHE_ALIAS]["OPTIONS"] = {
+        "MAX_ENTRIES": int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000)),
+    }
+
+# Bulk create/upsert (POST /api/<resource>/bulk/)
+
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", 10000))
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", 1000))
+
+# Invalid polygons are repaired with GEOS make_valid instead of being rejected
+
+GEOMETRY_MAKE_VALID = os.getenv("GEOMETRY_MAKE_VALID", "0") == "1"
+
+# Export (manage.py export_geo, GET /api/<resource>/export?format=ndjson|gpkg|fgb)
+# Rows are read through a server-side cursor in chunks of EXPORT_CHUNK_SIZE
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 2000))
+
+# Async views (/api/async/...): threads for blocking GEOS/file work
+
+ASYNC_BLOCKING_WORKERS = int(os.getenv("ASYNC_BLOCKING_WORKERS", 4))
+
+# Nearest neighbours (GET /api/<resource>/nearest?lon=&lat=&k=&max_distance=)
+
+NEAREST_MAX_K = int(os.getenv("NEAREST_MAX_K", 100))
+
+# Reverse geocoding (GET/POST /api/locate)
+# LOCATE_INDEX=1 answers from a per-process shapely STRtree when shapely 2 is installed, otherwise PostGIS
+
+LOCATE_INDEX = os.getenv("LOCATE_INDEX", "1") == "1"
+LOCATE_MAX_POINTS = int(os.getenv("LOCATE_MAX_POINTS", 10000))
+# How often (seconds) the index checks row count and max(updated_at) of its table for changes
+LOCATE_INDEX_CHECK_INTERVAL = float(os.getenv("LOCATE_INDEX_CHECK_INTERVAL", 10))
+
+# Django REST framework
+# FastJSONRenderer uses orjson when it is installed and splices pre-encoded geometry
+
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        os.getenv("JSON_RENDERER", "geo_db.renderers.FastJSONRenderer"),
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
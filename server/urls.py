@@ -17,7 +17,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from geo_db.views import prometheus_metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path("metrics", prometheus_metrics, name="metrics"),
     path("api/", include("geo_db.urls"))
 ]